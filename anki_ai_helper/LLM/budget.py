@@ -0,0 +1,35 @@
+import math
+from typing import Optional
+
+
+class TokenBudget:
+    def __init__(
+        self,
+        default: int = 256,
+        warmup: int = 32,
+        margin: float = 1.5,
+        minimum: int = 48,
+    ):
+        self.default = default
+        self.warmup = warmup
+        self.margin = margin
+        self.minimum = minimum
+
+        self.n_observed = 0
+        self.longest = 0
+
+    def limit(self) -> Optional[int]:
+        if self.n_observed < self.warmup:
+            return None
+
+        return min(self.default, max(self.minimum, math.ceil(self.longest * self.margin)))
+
+    def record(self, n_tokens: int, parsed: bool) -> None:
+        limit = self.limit()
+
+        if parsed:
+            self.n_observed += 1
+            self.longest = max(self.longest, n_tokens)
+        elif limit is not None and n_tokens >= limit - 1:
+            # The response was probably cut by the budget itself, so let it grow
+            self.longest = max(self.longest, limit)
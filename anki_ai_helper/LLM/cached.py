@@ -0,0 +1,272 @@
+import functools
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from typing import Dict, List, Optional, Tuple, Type
+
+from anki_ai_helper.helper.io import create_package_directory
+
+from .interface import LlmSingleShot
+
+
+CACHE_DIRECTORY = "llm_cache"
+
+
+class LlmResponseCache:
+    def __init__(self, path: str, max_entries: int, max_bytes: int):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # Access times of hits, written with the next write so reads never
+        # hold a write lock other processes sharing the cache would wait on
+        self._accessed: Dict[str, float] = {}
+
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL,
+                max_new_tokens INTEGER,
+                complete INTEGER NOT NULL DEFAULT 1
+            )
+            """
+        )
+        # Caches written before the budget was stored per response
+        columns = {
+            row[1] for row in self.connection.execute("PRAGMA table_info(responses)")
+        }
+        if "max_new_tokens" not in columns:
+            self.connection.execute(
+                "ALTER TABLE responses ADD COLUMN max_new_tokens INTEGER"
+            )
+            self.connection.execute(
+                "ALTER TABLE responses ADD COLUMN complete INTEGER NOT NULL DEFAULT 1"
+            )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)"
+        )
+        self.connection.commit()
+
+    def get(self, key: str, max_new_tokens: Optional[int] = None) -> Optional[str]:
+        row = self.connection.execute(
+            "SELECT response, max_new_tokens, complete FROM responses WHERE key = ?",
+            (key,),
+        ).fetchone()
+
+        if row is None or not _covers(row[1], bool(row[2]), max_new_tokens):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._accessed[key] = time.time()
+        return row[0]
+
+    def put_many(
+        self,
+        responses: Dict[str, Tuple[str, bool]],
+        max_new_tokens: Optional[int] = None,
+    ) -> None:
+        # Every response maps to its text and whether it ended before the
+        # max_new_tokens budget it was generated with
+        now = time.time()
+        with self.connection:
+            self._write_accesses()
+            self.connection.executemany(
+                """
+                INSERT OR REPLACE INTO responses
+                    (key, response, size, last_access, max_new_tokens, complete)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                [
+                    (
+                        key,
+                        response,
+                        len(response.encode()),
+                        now,
+                        max_new_tokens,
+                        complete,
+                    )
+                    for key, (response, complete) in responses.items()
+                ],
+            )
+            self._evict()
+
+    def delete_many(self, keys: List[str]) -> None:
+        with self.connection:
+            self.connection.executemany(
+                "DELETE FROM responses WHERE key = ?", [(key,) for key in keys]
+            )
+
+    def stats(self) -> Dict[str, int]:
+        entries, size = self.connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": entries,
+            "bytes": size,
+        }
+
+    def close(self) -> None:
+        with self.connection:
+            self._write_accesses()
+        self.connection.close()
+
+    def _write_accesses(self) -> None:
+        self.connection.executemany(
+            "UPDATE responses SET last_access = ? WHERE key = ?",
+            [(accessed, key) for key, accessed in self._accessed.items()],
+        )
+        self._accessed = {}
+
+    def _evict(self) -> None:
+        entries, size = self.connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        if entries <= self.max_entries and size <= self.max_bytes:
+            return
+
+        evicted = []
+        for key, entry_size in self.connection.execute(
+            "SELECT key, size FROM responses ORDER BY last_access"
+        ):
+            if entries <= self.max_entries and size <= self.max_bytes:
+                break
+            evicted.append((key,))
+            entries -= 1
+            size -= entry_size
+
+        self.connection.executemany("DELETE FROM responses WHERE key = ?", evicted)
+
+
+def _covers(
+    stored_budget: Optional[int], complete: bool, max_new_tokens: Optional[int]
+) -> bool:
+    # A response that ended on its own answers any budget. One cut by its
+    # budget only answers requests that would be cut as early or earlier.
+    # No budget means the model's default, which the learned ones never exceed
+    if complete or stored_budget is None:
+        return True
+    return max_new_tokens is not None and max_new_tokens <= stored_budget
+
+
+class CachedLlm(LlmSingleShot):
+    def __init__(
+        self,
+        system_prompt: str,
+        model: Type[LlmSingleShot],
+        cache_name: str = "responses",
+        max_entries: int = 200_000,
+        max_bytes: int = 512 * 1024 * 1024,
+    ):
+        self.system_prompt = system_prompt
+        self.llm = model(system_prompt)
+        self.cache_path = os.path.join(
+            create_package_directory(CACHE_DIRECTORY), f"{cache_name}.sqlite"
+        )
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self.cache = None
+        self._llm_loaded = False
+
+    @classmethod
+    def wrap(cls, model: Type[LlmSingleShot], **kwargs):
+        return functools.partial(cls, model=model, **kwargs)
+
+    def __enter__(self) -> "CachedLlm":
+        # The wrapped model is only loaded on the first cache miss
+        self.cache = LlmResponseCache(self.cache_path, self.max_entries, self.max_bytes)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        try:
+            stats = self.cache.stats()
+            print(
+                f"LLM cache hits: {stats['hits']}, misses: {stats['misses']}, entries: {stats['entries']}"
+            )
+            self.cache.close()
+
+            if self._llm_loaded:
+                self._llm_loaded = False
+                return self.llm.__exit__(exc_type, exc_value, traceback)
+            return True
+        except Exception as e:
+            print(f"Unable to gracefully stop the cached model. Error: {e}")
+            return False
+
+    def shoot(self, prompt: str) -> str:
+        return self.shoot_batch([prompt], batch_size=1)[0]
+
+    def shoot_batch(
+        self,
+        prompts: List[str],
+        batch_size: int = 8,
+        max_new_tokens: Optional[int] = None,
+        json_response: bool = False,
+    ) -> List[Optional[str]]:
+        # The learned budget differs between runs, so it isn't part of the key.
+        # Responses cut short by a smaller budget are generated again
+        keys = [self._cache_key(prompt, json_response) for prompt in prompts]
+        responses = [self.cache.get(key, max_new_tokens) for key in keys]
+
+        missing = [i for i, response in enumerate(responses) if response is None]
+        if not missing:
+            return responses
+
+        if not self._llm_loaded:
+            self.llm.__enter__()
+            self._llm_loaded = True
+
+        generated = self.llm.shoot_batch(
+            [prompts[i] for i in missing],
+            batch_size=batch_size,
+            max_new_tokens=max_new_tokens,
+            json_response=json_response,
+        )
+        for i, response in zip(missing, generated):
+            responses[i] = response
+
+        self.cache.put_many(
+            {
+                keys[i]: (responses[i], self._is_complete(responses[i], max_new_tokens))
+                for i in missing
+                if responses[i]
+            },
+            max_new_tokens,
+        )
+
+        return responses
+
+    def discard(self, prompts: List[str], json_response: bool = False) -> None:
+        # Generation samples, so the next request may get a usable answer
+        self.cache.delete_many(
+            [self._cache_key(prompt, json_response) for prompt in prompts]
+        )
+
+    def request_signature(self, prompt: str, json_response: bool = False) -> Dict:
+        return self.llm.request_signature(prompt, json_response)
+
+    def count_tokens(self, text: str) -> int:
+        return self.llm.count_tokens(text)
+
+    def _is_complete(self, response: str, max_new_tokens: Optional[int]) -> bool:
+        # The model is loaded here, so this counts with its own tokenizer
+        if max_new_tokens is None:
+            return True
+        return self.llm.count_tokens(response) < max_new_tokens - 1
+
+    def _cache_key(self, prompt: str, json_response: bool) -> str:
+        signature = json.dumps(
+            self.request_signature(prompt, json_response), sort_keys=True
+        )
+        return hashlib.sha256(signature.encode()).hexdigest()
@@ -0,0 +1,231 @@
+import hashlib
+import torch
+from typing import Any, Dict, List, Optional
+from transformers import AutoTokenizer, AutoModelForCausalLM, LogitsProcessorList
+from transformers.cache_utils import DynamicCache
+
+from anki_ai_helper.helper.model_pool import model_pool
+
+from .interface import LlmSingleShot
+from .json_stopping import JsonObjectLogitsProcessor
+
+
+class LlmBackend:
+    def __init__(
+        self,
+        device: str = "cuda",
+        dtype: str = "bfloat16",
+        int8: bool = False,
+        n_threads: Optional[int] = None,
+    ):
+        self.device = device
+        # Dynamic int8 quantization only applies to float32 Linear layers
+        self.dtype = "float32" if int8 else dtype
+        self.int8 = int8
+        self.n_threads = n_threads
+
+
+CUDA_BACKEND = LlmBackend()
+CPU_BF16_BACKEND = LlmBackend(device="cpu", dtype="bfloat16")
+CPU_INT8_BACKEND = LlmBackend(device="cpu", int8=True)
+
+
+class CausalLmSingleShot(LlmSingleShot):
+    MODEL_NAME: str
+    _template: str
+    default_backend: LlmBackend = CUDA_BACKEND
+
+    _generation_config = {
+        "max_new_tokens": 256,
+        "min_new_tokens": 0,
+        "do_sample": True,
+        "temperature": 0.2,
+        "top_k": 50,
+        "top_p": 0.3,
+    }
+
+    def __init__(self, system_prompt: str, backend: Optional[LlmBackend] = None):
+        self.model = None
+        self.tokenizer = None
+        self.system_prompt = system_prompt
+        self.backend = backend if backend is not None else self.default_backend
+
+        self._prefix_ids = None
+        self._prefix_cache = None
+
+    def __enter__(self) -> "CausalLmSingleShot":
+        if self.backend.n_threads:
+            torch.set_num_threads(self.backend.n_threads)
+
+        self.tokenizer, self.model = model_pool.acquire(
+            self._pool_key(), self._load, self.backend.device
+        )
+        self._prefix_ids, self._prefix_cache = self._prefill_system_prompt()
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        try:
+            self.model = None
+            self.tokenizer = None
+            self._prefix_cache = None
+            # The pool decides whether the weights stay resident
+            model_pool.release(self._pool_key())
+            return True
+        except Exception as e:
+            print(f"Unable to gracefully stop the model. Error: {e}")
+            return False
+
+    def _pool_key(self):
+        return (
+            "llm",
+            self.MODEL_NAME,
+            self.backend.device,
+            self.backend.dtype,
+            self.backend.int8,
+        )
+
+    def _load(self):
+        tokenizer = AutoTokenizer.from_pretrained(
+            self.MODEL_NAME,
+            use_fast=True,
+            model_max_length=4096,
+            do_sample=True,
+            padding_side="left",
+        )
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.bos_token
+
+        model = AutoModelForCausalLM.from_pretrained(
+            self.MODEL_NAME,
+            device_map=self.backend.device,
+            torch_dtype=getattr(torch, self.backend.dtype),
+            max_position_embeddings=4096,
+            do_sample=True,
+        )
+        if self.backend.int8:
+            model = torch.ao.quantization.quantize_dynamic(
+                model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+
+        return tokenizer, model
+
+    def shoot(self, prompt: str) -> str:
+        return self.shoot_batch([prompt], batch_size=1)[0]
+
+    def shoot_batch(
+        self,
+        prompts: List[str],
+        batch_size: int = 8,
+        max_new_tokens: Optional[int] = None,
+        json_response: bool = False,
+    ) -> List[Optional[str]]:
+        responses = []
+        for i in range(0, len(prompts), batch_size):
+            responses.extend(
+                self._generate(
+                    prompts[i : i + batch_size], max_new_tokens, json_response
+                )
+            )
+
+        return responses
+
+    def count_tokens(self, text: str) -> int:
+        if self.tokenizer is None:
+            return super().count_tokens(text)
+
+        return len(self.tokenizer(text, add_special_tokens=False)["input_ids"])
+
+    def request_signature(
+        self, prompt: str, json_response: bool = False
+    ) -> Dict[str, Any]:
+        return {
+            "model": self.MODEL_NAME,
+            "system_prompt": hashlib.sha256(self.system_prompt.encode()).hexdigest(),
+            "prompt": self._fill_query(prompt),
+            "generation": self._generation_config,
+            "json_response": json_response,
+        }
+
+    def _system_prefix(self) -> str:
+        prefix = self._template.split("{query}")[0]
+        # The tokenizer's leading-space marker on the query restores the space
+        return prefix.replace("{system}", self.system_prompt).rstrip()
+
+    def _fill_query(self, prompt: str) -> str:
+        return prompt + self._template.split("{query}")[1]
+
+    @torch.no_grad()
+    def _prefill_system_prompt(self):
+        prefix_ids = self.tokenizer(
+            self._system_prefix(), return_tensors="pt", return_token_type_ids=False
+        )["input_ids"].to(self.backend.device)
+
+        past_key_values = self.model(prefix_ids, use_cache=True).past_key_values
+        if isinstance(past_key_values, DynamicCache):
+            past_key_values = past_key_values.to_legacy_cache()
+
+        return prefix_ids, past_key_values
+
+    def _copy_prefix_cache(self, batch_size: int) -> DynamicCache:
+        # generate() extends the cache in place, so every call gets its own copy
+        return DynamicCache.from_legacy_cache(
+            tuple(
+                (
+                    key.expand(batch_size, -1, -1, -1).contiguous(),
+                    value.expand(batch_size, -1, -1, -1).contiguous(),
+                )
+                for key, value in self._prefix_cache
+            )
+        )
+
+    @torch.no_grad()
+    def _generate(
+        self,
+        prompts: List[str],
+        max_new_tokens: Optional[int] = None,
+        json_response: bool = False,
+    ) -> List[Optional[str]]:
+        queries = self.tokenizer(
+            [self._fill_query(prompt) for prompt in prompts],
+            return_tensors="pt",
+            padding=True,
+            add_special_tokens=False,
+            return_token_type_ids=False,
+        ).to(self.backend.device)
+
+        # Only the query tokens are prefilled, the system prompt comes from the
+        # cache. Left padding puts the pads between the system prompt and the
+        # query, which the attention mask hides.
+        batch_size = len(prompts)
+        prefix_ids = self._prefix_ids.expand(batch_size, -1)
+        input_ids = torch.cat([prefix_ids, queries["input_ids"]], dim=1)
+        attention_mask = torch.cat(
+            [torch.ones_like(prefix_ids), queries["attention_mask"]], dim=1
+        )
+
+        generation_config = dict(self._generation_config)
+        if max_new_tokens is not None:
+            generation_config["max_new_tokens"] = max_new_tokens
+
+        logits_processor = LogitsProcessorList()
+        if json_response:
+            logits_processor.append(
+                JsonObjectLogitsProcessor(self.tokenizer, batch_size)
+            )
+
+        outputs_gen = self.model.generate(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            past_key_values=self._copy_prefix_cache(batch_size),
+            logits_processor=logits_processor,
+            **generation_config,
+            eos_token_id=self.tokenizer.eos_token_id,
+            pad_token_id=self.tokenizer.pad_token_id,
+        )
+
+        # The generated tokens of the whole batch start right after the inputs
+        new_tokens = outputs_gen[:, input_ids.shape[1] :]
+        responses = self.tokenizer.batch_decode(new_tokens, skip_special_tokens=True)
+
+        return [response.strip() for response in responses]
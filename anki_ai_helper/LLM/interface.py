@@ -1,4 +1,5 @@
 from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
 
 
 class LlmSingleShot(ABC):
@@ -17,3 +18,32 @@ class LlmSingleShot(ABC):
     @abstractmethod
     def shoot(self, prompt: str) -> str:
         raise Exception("I haven't been implemented yet")
+
+    def shoot_batch(
+        self,
+        prompts: List[str],
+        batch_size: int = 8,
+        max_new_tokens: Optional[int] = None,
+        json_response: bool = False,
+    ) -> List[Optional[str]]:
+        return [self.shoot(prompt) for prompt in prompts]
+
+    def discard(self, prompts: List[str], json_response: bool = False) -> None:
+        # Called with the prompts whose responses the caller couldn't use, so
+        # models that keep responses don't return them again
+        pass
+
+    def count_tokens(self, text: str) -> int:
+        # Rough estimate for models without an accessible tokenizer
+        return max(1, len(text) // 4)
+
+    def request_signature(
+        self, prompt: str, json_response: bool = False
+    ) -> Dict[str, Any]:
+        # The max_new_tokens budget is left out, it changes between runs
+        return {
+            "model": type(self).__name__,
+            "system_prompt": getattr(self, "system_prompt", None),
+            "prompt": prompt,
+            "json_response": json_response,
+        }
@@ -0,0 +1,60 @@
+import torch
+from transformers import LogitsProcessor
+
+
+class JsonObjectScanner:
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.closed = False
+
+    def feed(self, text: str) -> bool:
+        for char in text:
+            if self.closed:
+                break
+
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"' and self.depth > 0:
+                self.in_string = True
+            elif char == "{":
+                self.depth += 1
+            elif char == "}" and self.depth > 0:
+                self.depth -= 1
+                self.closed = self.depth == 0
+
+        return self.closed
+
+
+class JsonObjectLogitsProcessor(LogitsProcessor):
+    # Finishing a sequence by forcing EOS, rather than through a stopping
+    # criterion, stops each sequence of a batch on its own
+    def __init__(self, tokenizer, batch_size: int):
+        self.tokenizer = tokenizer
+        self.scanners = [JsonObjectScanner() for _ in range(batch_size)]
+        self._input_length = None
+
+    def __call__(
+        self, input_ids: torch.LongTensor, scores: torch.FloatTensor
+    ) -> torch.FloatTensor:
+        if self._input_length is None:
+            self._input_length = input_ids.shape[1]
+        else:
+            for scanner, token_id in zip(self.scanners, input_ids[:, -1].tolist()):
+                if not scanner.closed:
+                    scanner.feed(
+                        self.tokenizer.decode([token_id], skip_special_tokens=True)
+                    )
+
+        closed = [i for i, scanner in enumerate(self.scanners) if scanner.closed]
+        if closed:
+            scores[closed, :] = -float("inf")
+            scores[closed, self.tokenizer.eos_token_id] = 0
+
+        return scores
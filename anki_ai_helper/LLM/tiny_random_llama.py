@@ -0,0 +1,12 @@
+from .causal_lm import CausalLmSingleShot, LlmBackend
+
+
+# A randomly initialised Llama of a few MB. Its answers are gibberish, but it
+# runs the whole generation path on machines without a GPU.
+MODEL_NAME = "hf-internal-testing/tiny-random-LlamaForCausalLM"
+
+
+class TinyRandomLlama(CausalLmSingleShot):
+    MODEL_NAME: str = MODEL_NAME
+    _template: str = "{system} USER: {query} ASSISTANT:"
+    default_backend: LlmBackend = LlmBackend(device="cpu", dtype="float32")
@@ -1,8 +1,9 @@
-import gc
 import torch
 from PIL import Image
 from diffusers import StableDiffusionPipeline
 
+from anki_ai_helper.helper.model_pool import model_pool
+
 from .interfaces import T2I, T2IConfig
 
 
@@ -18,23 +19,27 @@ class StableDiffusionV15(T2I):
         self.pipe = None
 
     def __enter__(self) -> "StableDiffusion":
-        self.pipe = StableDiffusionPipeline.from_pretrained(
-            self.config.model_id, torch_dtype=torch.float16
-        )
-        self.pipe.to("cuda")
+        self.pipe = model_pool.acquire(self._pool_key(), self._load, "cuda")
         return self
 
     def __exit__(self, exc_type, exc_value, traceback) -> bool:
         try:
-            del self.pipe
-            if torch.cuda.is_available():
-                torch.cuda.empty_cache()
-            gc.collect()
+            self.pipe = None
+            model_pool.release(self._pool_key())
             return True
         except Exception as e:
             print(f"Unable to gracefully stop the model. Error: {e}")
             return False
 
+    def _pool_key(self):
+        return ("t2i", self.config.model_id)
+
+    def _load(self):
+        pipe = StableDiffusionPipeline.from_pretrained(
+            self.config.model_id, torch_dtype=torch.float16
+        )
+        return pipe.to("cuda")
+
     def run(
         self,
         prompt: str,
@@ -1,13 +1,9 @@
-import gc
-import nltk
-import torch
-from TTS.api import TTS
+import threading
 from typing import Dict
 
-from .interface import T2S
+from anki_ai_helper.helper.model_pool import model_pool
 
-# Download Punkt tokenizer (divides a text into a list of sentences)
-nltk.download("punkt")
+from .interface import T2S
 
 
 class T2SLangSetting:
@@ -24,8 +20,25 @@ T2S_MODELS: Dict[str, T2SLangSetting] = {
 }
 
 
+_punkt_ready = False
+_punkt_lock = threading.Lock()
+
+
+def _download_punkt() -> None:
+    # Download Punkt tokenizer (divides a text into a list of sentences).
+    # Done on first use so importing the package never touches the network
+    global _punkt_ready
+
+    with _punkt_lock:
+        if not _punkt_ready:
+            import nltk
+
+            nltk.download("punkt")
+            _punkt_ready = True
+
+
 class TTSV2(T2S):
-    _device = "cuda" if torch.cuda.is_available() else "cpu"
+    _device = None
 
     def __init__(self, lang: str, asset_dir_path: str):
         self.lang = lang
@@ -39,21 +52,37 @@ class TTSV2(T2S):
         self.speaker = T2S_MODELS[lang].speaker
 
     def __enter__(self) -> "T2S":
-        self.tts = TTS(self.model).to(self._device)
+        _download_punkt()
+
+        self.tts = model_pool.acquire(self._pool_key(), self._load, self._device_name())
 
         return self
 
     def __exit__(self, exc_type, exc_value, traceback) -> bool:
         try:
-            del self.tts
-            if torch.cuda.is_available():
-                torch.cuda.empty_cache()
-            gc.collect()
+            self.tts = None
+            model_pool.release(self._pool_key())
             return True
         except Exception as e:
             print(f"Unable to gracefully stop TTS. Error: {e}")
             return False
 
+    def _pool_key(self):
+        return ("t2s", self.model, self._device_name())
+
+    def _load(self):
+        from TTS.api import TTS
+
+        return TTS(self.model).to(self._device_name())
+
+    @classmethod
+    def _device_name(cls) -> str:
+        if cls._device is None:
+            import torch
+
+            cls._device = "cuda" if torch.cuda.is_available() else "cpu"
+        return cls._device
+
     def shoot(self, text: str, filename: str) -> str:
         filename = filename.replace(".wav", "")
         file_path = f"{self.asset_dir_path}/{filename}.wav"
@@ -1,15 +1,16 @@
-import torch
-from typing import Dict, Optional
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple, Type
+from concurrent.futures import ProcessPoolExecutor
 from tqdm import tqdm
+import multiprocessing
 import traceback
-import random
-import time
+import threading
 import json
 import uuid
 import os
-from pydub import AudioSegment
+import numpy as np
 import pandas as pd
 
+from anki_ai_helper.LLM.budget import TokenBudget
 from anki_ai_helper.LLM.interface import LlmSingleShot
 from anki_ai_helper.dataset.interface import (
     WordList,
@@ -22,6 +23,7 @@ from anki_ai_helper.anki.style.two_sentence_puzzler import (
     TwoSentencePuzzlerFields,
     TwoSentencePuzzlerNote,
 )
+from anki_ai_helper.T2S.interface import T2S
 from anki_ai_helper.T2S.tts_v2 import TTSV2
 from anki_ai_helper.anki.deck import AnkiDeck
 
@@ -29,6 +31,56 @@ from anki_ai_helper.helper import string as str_helper
 from anki_ai_helper.helper import english as eng_helper
 from anki_ai_helper.helper import german as ger_helper
 from anki_ai_helper.helper import io as io_helper
+from anki_ai_helper.helper.async_fetch import AsyncFetcher
+from anki_ai_helper.helper.http_cache import HttpCache
+from anki_ai_helper.helper.inflection_store import InflectionStore
+from anki_ai_helper.helper.pipeline import Pipeline, Stage
+from anki_ai_helper.helper.storage import FrameStorage
+
+
+GERMAN_VOICE_COLUMNS = [
+    "word",
+    "expl_1",
+    "1_pzl",
+    "1_pzl_vce",
+    "1_fil",
+    "1_fil_vce",
+    "2_pzl",
+    "2_pzl_vce",
+    "2_fil",
+    "2_fil_vce",
+]
+
+ENGLISH_VOICE_COLUMNS = [
+    "word",
+    "word_trans",
+    "1_trans",
+    "1_trans_vce",
+    "2_trans",
+    "2_trans_vce",
+]
+
+VOICE_COLUMNS = [
+    "1_pzl_vce",
+    "1_fil_vce",
+    "2_pzl_vce",
+    "2_fil_vce",
+    "1_trans_vce",
+    "2_trans_vce",
+]
+
+PUZZLE_COLUMNS = {"1_pzl": "1_fil", "2_pzl": "2_fil"}
+
+PLAN_STAGES = ["generate", "puzzle", "declension", "conjugation", "voice", "mp3"]
+
+
+class PlannedWord(NamedTuple):
+    position: int
+    word: str
+    type: str
+
+
+Plan = Dict[str, List[Tuple[PlannedWord, str]]]
 
 
 class AiSprachMeisterPrompt:
@@ -75,59 +127,100 @@ class AiSprachMeisterPrompt:
                 },
             },
         },
+        "combined": {
+            "word": {
+                "Noun": f"Strictly adhering to the JSON format, translate the German noun '{WORD_PLACEHOLDER}' to English, then write two German sentences with their English translations. The descriptive sentence starts with 'Das Wort {WORD_PLACEHOLDER} bedeutet' and accurately describes the noun. The example sentence uses '{WORD_PLACEHOLDER}' exactly once as a noun in a conversational context. Respond with a single JSON object with the keys 'German', 'English', 'Descriptive' and 'Example', where 'Descriptive' and 'Example' each contain 'German' and 'English' keys. Example in JSON: {{ \"German\": \"der Hund\", \"English\": \"dog\", \"Descriptive\": {{ \"German\": \"Das Wort der Hund bedeutet ein Haustier.\", \"English\": \"The word 'Hund' means a pet.\" }}, \"Example\": {{ \"German\": \"Der Hund steht auf dem Tisch.\", \"English\": \"The dog is on the table.\" }} }}. Proceed with '{WORD_PLACEHOLDER}' following this exact JSON structure. Please use simplest German words and sentneces.",
+                "Verb": f"Using JSON format exclusively, translate the German verb '{WORD_PLACEHOLDER}' into English, then write two German sentences with their English translations. The descriptive sentence begins with 'Das Verb {WORD_PLACEHOLDER} bedeutet' and precisely explains the verb. The example sentence uses '{WORD_PLACEHOLDER}' just once as a verb in a daily conversation. Respond with a single JSON object with the keys 'German', 'English', 'Descriptive' and 'Example', where 'Descriptive' and 'Example' each contain 'German' and 'English' keys. Example in JSON: {{ \"German\": \"gehen\", \"English\": \"go\", \"Descriptive\": {{ \"German\": \"Das Verb gehen bedeutet, sich zu Fuß von einem Ort zum anderen zu bewegen.\", \"English\": \"The verb 'gehen' means to move from one place to another on foot.\" }}, \"Example\": {{ \"German\": \"Ich gehe zum Geschäft.\", \"English\": \"I go to the store.\" }} }}. Proceed with '{WORD_PLACEHOLDER}', maintaining the specified JSON format. Please use simplest German words and sentneces.",
+                "Other": f"In a strict JSON format, translate the German word '{WORD_PLACEHOLDER}' (adjective/adverb/other) to English, then write two German sentences with their English translations. The descriptive sentence starts with 'Das Wort {WORD_PLACEHOLDER} bedeutet' and clearly defines the word. The example sentence uses '{WORD_PLACEHOLDER}' only once, as it might be used in everyday speech. Respond with a single JSON object with the keys 'German', 'English', 'Descriptive' and 'Example', where 'Descriptive' and 'Example' each contain 'German' and 'English' keys. Example in JSON: {{ \"German\": \"schnell\", \"English\": \"fast\", \"Descriptive\": {{ \"German\": \"Das Wort schnell bedeutet eine hohe Geschwindigkeit bei einer Bewegung oder Aktion.\", \"English\": \"The word 'schnell' means a high speed in movement or action.\" }}, \"Example\": {{ \"German\": \"Das Auto ist schnell.\", \"English\": \"The car is fast.\" }} }}. Proceed with '{WORD_PLACEHOLDER}', keeping the JSON format intact. Please use simplest German words and sentneces.",
+            },
+        },
     }
 
     def __init__(self) -> None:
-        pass
-
-    def translate(
-        self, model: LlmSingleShot, word: str, word_type: str
-    ) -> Optional[Dict]:
-        if word_type in self.PROMPTS["translation"]["word"]:
-            prompt = self.PROMPTS["translation"]["word"][word_type]
-            response = (
-                self._prompt_to_json(model, prompt, word, None) if prompt else None
-            )
-
-            return str_helper.find_and_parse_json(response, ["German", "English"])
-
-        return None
-
-    def describe(
-        self, model: LlmSingleShot, word: str, word_type: str, translation: str
-    ) -> Optional[Dict]:
-        if word_type in self.PROMPTS["generate"]["sentence"]["descriptive"]:
-            prompt = self.PROMPTS["generate"]["sentence"]["descriptive"][word_type]
-            response = (
-                self._prompt_to_json(model, prompt, word, translation)
-                if prompt
-                else None
-            )
-
-            return str_helper.find_and_parse_json(response, ["German", "English"])
+        # max_new_tokens budgets learned from the observed response lengths
+        self.budgets = {
+            "translation": TokenBudget(),
+            "sentence": TokenBudget(),
+            "combined": TokenBudget(),
+        }
 
-        return None
+    def translate_batch(
+        self, model: LlmSingleShot, words: List[Tuple[str, str]], batch_size: int = 8
+    ) -> List[Optional[Dict]]:
+        prompts = self.PROMPTS["translation"]["word"]
+        items = [(prompts, word, word_type, None) for word, word_type in words]
+
+        return self._prompt_batch_to_json(model, items, batch_size, "translation")
+
+    def describe_and_example_batch(
+        self,
+        model: LlmSingleShot,
+        words: List[Tuple[str, str, str]],
+        batch_size: int = 8,
+    ) -> List[Tuple[Optional[Dict], Optional[Dict]]]:
+        prompts = self.PROMPTS["generate"]["sentence"]
+        items = [
+            (prompts[kind], word, word_type, translation)
+            for word, word_type, translation in words
+            for kind in ["descriptive", "example"]
+        ]
+        results = self._prompt_batch_to_json(model, items, batch_size, "sentence")
+
+        return list(zip(results[0::2], results[1::2]))
+
+    def translate_describe_and_example_batch(
+        self, model: LlmSingleShot, words: List[Tuple[str, str]], batch_size: int = 8
+    ) -> List[Optional[Dict]]:
+        prompts = self.PROMPTS["combined"]["word"]
+        items = [(prompts, word, word_type, None) for word, word_type in words]
+        return self._prompt_batch_to_json(
+            model,
+            items,
+            batch_size,
+            "combined",
+            ["German", "English", "Descriptive", "Example"],
+            _has_both_sentences,
+        )
 
-    def example(
-        self, model: LlmSingleShot, word: str, word_type: str, translation: str
-    ) -> Optional[Dict]:
-        if word_type in self.PROMPTS["generate"]["sentence"]["example"]:
-            prompt = self.PROMPTS["generate"]["sentence"]["example"][word_type]
-            response = (
-                self._prompt_to_json(model, prompt, word, translation)
-                if prompt
-                else None
-            )
+    def _prompt_batch_to_json(
+        self,
+        model: LlmSingleShot,
+        items: List[Tuple[Dict[str, str], str, str, Optional[str]]],
+        batch_size: int,
+        budget_name: str,
+        keys: Optional[List[str]] = None,
+        is_valid: Optional[Callable[[Dict], bool]] = None,
+    ) -> List[Optional[Dict]]:
+        keys = keys if keys is not None else ["German", "English"]
+        budget = self.budgets[budget_name]
+        prompts = {
+            i: self._prepare_prompt(prompts_raw[word_type], word, translation)
+            for i, (prompts_raw, word, word_type, translation) in enumerate(items)
+            if prompts_raw.get(word_type)
+        }
+        max_new_tokens = budget.limit()
+        responses = model.shoot_batch(
+            list(prompts.values()),
+            batch_size=batch_size,
+            max_new_tokens=max_new_tokens,
+            json_response=True,
+        )
 
-            return str_helper.find_and_parse_json(response, ["German", "English"])
+        results = [None] * len(items)
+        rejected = []
+        for (i, prompt), response in zip(prompts.items(), responses):
+            if response:
+                results[i] = str_helper.find_and_parse_json(response, keys)
+                if results[i] is not None and is_valid and not is_valid(results[i]):
+                    results[i] = None
+                if results[i] is None:
+                    rejected.append(prompt)
+            budget.record(model.count_tokens(response or ""), results[i] is not None)
 
-        return None
+        if rejected:
+            model.discard(rejected, json_response=True)
 
-    def _prompt_to_json(
-        self, model: LlmSingleShot, prompt_raw: str, word: str, translation: str
-    ) -> str:
-        prompt = self._prepare_prompt(prompt_raw, word, translation)
-        return model.shoot(prompt)
+        return results
 
     def _prepare_prompt(self, prompt_raw: str, word: str, translation: str) -> str:
         prompt = prompt_raw.replace(self.WORD_PLACEHOLDER, word)
@@ -139,94 +232,287 @@ class AiSprachMeisterPrompt:
 
 
 class AiSprachMeister:
-    def __init__(self, model: LlmSingleShot, word_list: WordList, name: str) -> None:
+    def __init__(
+        self,
+        model: Type[LlmSingleShot],
+        word_list: WordList,
+        name: str,
+        t2s: Optional[Type[T2S]] = None,
+        storage: Optional[FrameStorage] = None,
+    ) -> None:
         self.word_list = word_list
-        self.puzzler = TwoSentencePuzzlerDataFrame()
+        self.puzzler = TwoSentencePuzzlerDataFrame(storage)
         self.model = model
+        self.t2s = t2s if t2s is not None else TTSV2
         self.prompt = AiSprachMeisterPrompt()
+        # Guards the puzzler when the stages run concurrently in run_pipeline
+        self._puzzler_lock = threading.RLock()
+        self._mp3_listing: Optional[Tuple[int, pd.Index]] = None
 
         self.filename = name
         self.puzzler.load_and_append(self.filename)
         self.puzzler.store(self.filename)
 
-    def generate_sentences(self, force: bool = False):
-        with torch.cuda.amp.autocast(dtype=torch.bfloat16), self.model(
-            self.prompt.SYSTEM_PROMPT
-        ) as self.llm:
+    def plan(self, force: bool = False, stages: Optional[List[str]] = None) -> Plan:
+        # Aligns the word list with the puzzler columns the stages need and
+        # returns the pending (word, column) tasks of every stage in word list
+        # order
+        stages = stages if stages is not None else PLAN_STAGES
+
+        words = self.word_list.df.drop_duplicates("word")
+        w = words["word"].to_numpy(dtype=object)
+        types = words["type"].to_numpy(dtype=object)
+        word_positions = np.flatnonzero(
+            ~self.word_list.df["word"].duplicated().to_numpy()
+        )
+
+        def inflection(columns, kind: str, has_inflection) -> Dict[str, np.ndarray]:
+            mask = types == kind
+            if not force:
+                mask[mask] = ~has_inflection(columns["expl_1"][mask].str.strip())
+            return {"expl_1": mask}
+
+        def mp3(columns, name: str) -> np.ndarray:
+            mask = columns.filled(name).copy()
+            mp3s = columns[name][mask].str.replace(".wav", ".mp3", regex=False)
+            mask[mask] = self._mp3_files().get_indexer(mp3s.astype(object)) < 0
+            return mask
+
+        masks = {
+            "generate": lambda columns: {"word": ~columns.has_row() | force},
+            "puzzle": lambda columns: {
+                pzl: columns.filled(fil) & (~columns.filled(pzl) | force)
+                for pzl, fil in PUZZLE_COLUMNS.items()
+            },
+            "declension": lambda columns: inflection(
+                columns, NOUN_TYPE.name, _declension_mask
+            ),
+            "conjugation": lambda columns: inflection(
+                columns, VERB_TYPE.name, _conjugation_mask
+            ),
+            "voice": lambda columns: {
+                vce: columns.filled(vce.removesuffix("_vce"))
+                & (~columns.filled(vce) | force)
+                for vce in VOICE_COLUMNS
+            },
+            "mp3": lambda columns: {vce: mp3(columns, vce) for vce in VOICE_COLUMNS},
+        }
+
+        # The rows of the words are looked up again only when the pipeline
+        # added rows to the puzzler between two stages
+        located: Dict[str, object] = {}
+
+        def aligned_columns() -> _AlignedColumns:
+            index = self.puzzler.key_index()
+            if located.get("index") is not index:
+                located.update(index=index, rows=self.puzzler.locate(w))
+            return _AlignedColumns(self.puzzler, located["rows"])
+
+        planned: Dict[int, PlannedWord] = {}
+        plan = {}
+        for stage in stages:
+            with self._puzzler_lock:
+                stage_masks = masks[stage](aligned_columns())
+            columns = list(stage_masks)
+            # Row-major nonzero keeps the tasks of a word together
+            word_indices, column_indices = np.nonzero(
+                np.column_stack([stage_masks[name] for name in columns])
+            )
+
+            plan[stage] = []
+            for i, c in zip(word_indices, column_indices):
+                if i not in planned:
+                    planned[i] = PlannedWord(int(word_positions[i]), w[i], types[i])
+                plan[stage].append((planned[i], columns[c]))
+
+        return plan
+
+    def generate_sentences(
+        self,
+        force: bool = False,
+        batch_size: int = 8,
+        combined: bool = False,
+        obscure: bool = True,
+        obscure_engine: str = "spacy",
+    ):
+        n_words, n_fallbacks = 0, 0
+
+        with _autocast(), self.model(self.prompt.SYSTEM_PROMPT) as self.llm:
             try:
-                for i, word in enumerate(tqdm(self.word_list)):
-                    processed_word = (
-                        self._generate_descriptive_and_example_senteces_for_word(
-                            word, force
+                words = _plan_words(self.plan(force, ["generate"])["generate"])
+
+                with tqdm(total=len(words)) as progress:
+                    for start in range(0, len(words), batch_size):
+                        batch = words[start : start + batch_size]
+                        processed_words, fallbacks = self._generate_batch(
+                            batch, batch_size, combined, obscure, obscure_engine
                         )
-                    )
-                    if processed_word:
+                        n_words += len(batch)
+                        n_fallbacks += len(fallbacks)
+
                         try:
-                            self.puzzler.upsert(
-                                processed_word["word"], processed_word["entries"]
+                            self.puzzler.upsert_many(
+                                {
+                                    processed_word["word"]: processed_word["entries"]
+                                    for processed_word in processed_words
+                                }
                             )
                         except Exception as e:
                             print(
-                                f"Unable to upsert the new entry. word: {processed_word['word']}",
+                                f"Unable to upsert the new entries. words: {[w.word for w in batch]}",
                                 e,
                             )
-                    self._store_progress(i)
+                        self._store_progress(start, start + len(batch))
+                        progress.update(len(batch))
             except Exception as e:
                 print(f"Error occurred: {e}")
                 traceback.print_exc()
 
+        if combined and n_words:
+            print(
+                f"Combined prompt fallback rate: {n_fallbacks}/{n_words} ({n_fallbacks / n_words:.1%})"
+            )
+
         self.puzzler.store(self.filename)
 
-    def fetch_extra_info(self):
-        self._fetch_extra_noun_info()
-        self._fetch_extra_verb_info()
+    def obscure_sentences(
+        self,
+        force: bool = False,
+        n_process: int = 1,
+        batch_size: int = 64,
+        chunk_size: int = 1000,
+        engine: str = "spacy",
+    ):
+        # Builds the puzzles of sentences generated with obscure=False, so the
+        # CPU bound spaCy work doesn't hold up the LLM
+        tasks = self.plan(force, ["puzzle"])["puzzle"]
+        sentences = {
+            fil: self.puzzler.get_column(fil) for fil in PUZZLE_COLUMNS.values()
+        }
 
-    def to_voice(self, force=False):
-        dir_path = io_helper.create_package_directory(self.filename)
+        with tqdm(total=len(tasks)) as progress:
+            for start in range(0, len(tasks), chunk_size):
+                chunk = tasks[start : start + chunk_size]
+                puzzles = ger_helper.obscure_closest_words(
+                    [
+                        (
+                            sentences[PUZZLE_COLUMNS[pzl]][word.word],
+                            ger_helper.remove_article(word.word),
+                        )
+                        for word, pzl in chunk
+                    ],
+                    n_process,
+                    batch_size,
+                    engine,
+                )
 
-        german_columns = [
-            "word",
-            "expl_1",
-            "1_pzl",
-            "1_pzl_vce",
-            "1_fil",
-            "1_fil_vce",
-            "2_pzl",
-            "2_pzl_vce",
-            "2_fil",
-            "2_fil_vce",
-        ]
+                entries: Dict[str, Dict[str, str]] = {}
+                for (word, pzl), puzzle in zip(chunk, puzzles):
+                    if puzzle:
+                        entries.setdefault(word.word, {})[pzl] = puzzle
 
-        def german_additional_texts(row, word_type):
-            expl_1_processed = (
-                _expl_to_string(row.get("expl_1"), word_type)
-                if row.get("expl_1")
-                else ""
+                self.puzzler.upsert_many(entries)
+                self.puzzler.store(self.filename)
+                progress.update(len(chunk))
+
+    def fetch_extra_info(
+        self,
+        fetcher: Optional[AsyncFetcher] = None,
+        chunk_size: int = 200,
+        offline: bool = False,
+        reparse: bool = False,
+        store: Optional[InflectionStore] = None,
+    ):
+        # Words found in the local inflection store never reach the network.
+        # The fetcher's per-host rate limit replaces the random sleeps between
+        # requests, results are stored after every chunk
+        store = store if store is not None else InflectionStore()
+
+        cache = None
+        if fetcher is None:
+            cache = HttpCache()
+            fetcher = AsyncFetcher(
+                headers=ger_helper.HEADERS, cache=cache, offline=offline
             )
-            return {
-                "1_fil": f"{row['word'] + '.' if not expl_1_processed else ''}{expl_1_processed}",
-            }
 
-        self._generate_voices(
-            "de", dir_path, german_columns, force, german_additional_texts
-        )
+        try:
+            self._fetch_extra_noun_info(fetcher, chunk_size, reparse, store)
+            self._fetch_extra_verb_info(fetcher, chunk_size, reparse, store)
+        finally:
+            if cache is not None:
+                stats = cache.stats()
+                print(
+                    f"HTTP cache hits: {stats['hits']}, revalidated: {stats['revalidated']}, downloads: {stats['misses']}, entries: {stats['entries']}"
+                )
+                cache.close()
+
+    def build_inflection_store(
+        self,
+        store: Optional[InflectionStore] = None,
+        cache: Optional[HttpCache] = None,
+    ) -> int:
+        # Collects the inflections known to the page cache and the puzzler,
+        # the puzzler wins where both have a word
+        store = store if store is not None else InflectionStore()
+        nouns = [w.word for w in self.word_list if w.type == NOUN_TYPE.name]
+        verbs = {
+            w.word: _reverso_verb(w.word)
+            for w in self.word_list
+            if w.type == VERB_TYPE.name
+        }
 
-        english_columns = [
-            "word",
-            "word_trans",
-            "1_trans",
-            "1_trans_vce",
-            "2_trans",
-            "2_trans_vce",
-        ]
+        entries = {}
+        own_cache = cache is None
+        cache = cache if cache is not None else HttpCache()
+        fetcher = AsyncFetcher(cache=cache, offline=True)
+
+        try:
+            declensions = ger_helper.fetch_declensions_from_collinsdictionary(
+                nouns, fetcher
+            )
+            for w, expl_1 in declensions.items():
+                if _has_declension(expl_1):
+                    entries[(NOUN_TYPE.name, w)] = expl_1
+
+            conjugations = ger_helper.fetch_conjugations_from_reverso(
+                set(verbs.values()), fetcher
+            )
+            for w, verb in verbs.items():
+                if _has_conjugation(conjugations.get(verb)):
+                    entries[(VERB_TYPE.name, w)] = conjugations[verb]
+        finally:
+            if own_cache:
+                cache.close()
+
+        expl_1s = self.puzzler.get_column("expl_1")
+        for w in nouns:
+            if _has_declension(expl_1s.get(w)):
+                entries[(NOUN_TYPE.name, w)] = expl_1s[w]
+        for w in verbs:
+            if _has_conjugation(expl_1s.get(w)):
+                entries[(VERB_TYPE.name, w)] = expl_1s[w]
+
+        return store.build(entries)
 
-        def english_additional_texts(row, _):
-            return {
-                "1_trans": f"{row['word_trans']}. " if row.get("word_trans") else "",
-            }
+    def to_voice(self, force=False):
+        dir_path = io_helper.create_package_directory(self.filename)
+        tasks = self.plan(force, ["voice"])["voice"]
 
         self._generate_voices(
-            "en", dir_path, english_columns, force, english_additional_texts
+            "de",
+            dir_path,
+            GERMAN_VOICE_COLUMNS,
+            force,
+            _german_additional_texts,
+            tasks,
+        )
+        self._generate_voices(
+            "en",
+            dir_path,
+            ENGLISH_VOICE_COLUMNS,
+            force,
+            _english_additional_texts,
+            tasks,
         )
 
         self.puzzler.store(self.filename)
@@ -234,28 +520,115 @@ class AiSprachMeister:
     def convert_to_mp3(self):
         dir_path = io_helper.create_package_directory(self.filename)
 
-        for word in tqdm(self.word_list):
-            w = word["word"]
-
-            row = self.puzzler.get_values(
-                key=w,
-                columns=[
-                    "1_pzl_vce",
-                    "1_fil_vce",
-                    "2_pzl_vce",
-                    "2_fil_vce",
-                    "1_trans_vce",
-                    "2_trans_vce",
-                ],
-            )
+        for word in tqdm(_plan_words(self.plan(stages=["mp3"])["mp3"])):
+            if self._convert_word_to_mp3(word.word, dir_path):
+                self.puzzler.store(self.filename)
 
+    def run_pipeline(
+        self,
+        force: bool = False,
+        batch_size: int = 8,
+        combined: bool = False,
+        obscure_workers: int = 2,
+        mp3_workers: int = 2,
+        queue_size: int = 32,
+        store_interval: int = 25,
+        obscure_engine: str = "spacy",
+    ):
+        dir_path = io_helper.create_package_directory(self.filename)
+        plan = self.plan(force, ["generate", "puzzle", "voice", "mp3"])
+        generate = _plan_words(plan["generate"])
+        rest = _plan_words(
+            plan["puzzle"] + plan["voice"] + plan["mp3"],
+            exclude={word.word for word in generate},
+        )
+        progress = tqdm(total=len(generate) + len(rest))
+        n_finished = [0]
+
+        def obscure(item):
+            _, word = item
+            w = word.word
+            with self._puzzler_lock:
+                row = self.puzzler.get_values(
+                    key=w, columns=["1_fil", "1_pzl", "2_fil", "2_pzl"]
+                )
             if not row:
-                continue
+                return None
+
+            columns = [
+                (fil, pzl)
+                for pzl, fil in PUZZLE_COLUMNS.items()
+                if row.get(fil) and (force or not row.get(pzl))
+            ]
+            if columns:
+                puzzles = obscure_pool.submit(
+                    ger_helper.obscure_closest_words,
+                    [(row[fil], ger_helper.remove_article(w)) for fil, _ in columns],
+                    engine=obscure_engine,
+                ).result()
+                with self._puzzler_lock:
+                    self.puzzler.upsert(
+                        key_value=w,
+                        entries={pzl: p for (_, pzl), p in zip(columns, puzzles)},
+                    )
 
-            for vce_filename in filter(None, row.values()):
-                self._convert_single_wav_file_to_mp3(vce_filename, dir_path)
+            return item
 
-            self.puzzler.store(self.filename)
+        def voice(item):
+            i, word = item
+            self._voice_word(
+                de_tts, i, word, GERMAN_VOICE_COLUMNS, force, _german_additional_texts
+            )
+            self._voice_word(
+                en_tts, i, word, ENGLISH_VOICE_COLUMNS, force, _english_additional_texts
+            )
+            return item
+
+        def mp3(item):
+            _, word = item
+            self._convert_word_to_mp3(word.word, dir_path)
+
+            with self._puzzler_lock:
+                n_finished[0] += 1
+                progress.update(1)
+                if n_finished[0] % store_interval == 0:
+                    self.puzzler.store(self.filename)
+
+            return item
+
+        pipeline = Pipeline(
+            [
+                Stage("obscure", obscure, obscure_workers, queue_size),
+                Stage("voice", voice, 1, queue_size),
+                Stage("mp3", mp3, mp3_workers, queue_size),
+            ]
+        )
+
+        # spaCy holds the GIL, so the puzzles are built in worker processes that
+        # each load the model once on start. Spawned, as forking would copy
+        # CUDA state
+        obscure_pool = ProcessPoolExecutor(
+            obscure_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=ger_helper.load_obscure_engine,
+            initargs=(obscure_engine,),
+        )
+
+        with obscure_pool, _autocast(), self.model(
+            self.prompt.SYSTEM_PROMPT
+        ) as self.llm, self.t2s("de", dir_path) as de_tts, self.t2s(
+            "en", dir_path
+        ) as en_tts:
+            try:
+                pipeline.run(
+                    self._pipeline_source(generate, rest, batch_size, combined)
+                )
+            except Exception as e:
+                print(f"Error occurred: {e}")
+                traceback.print_exc()
+
+        progress.close()
+        self.puzzler.store(self.filename)
 
     def package_deck(
         self, cards_per_deck: int, n_decks: int = None, force_all: bool = False
@@ -292,7 +665,7 @@ class AiSprachMeister:
         for deck_n in range(1, n_decks_calc + 1):
             l = (deck_n - 1) * cards_per_deck
             u = min(deck_n * cards_per_deck, total_words)
-            deck_words = self.word_list.to_list()[l:u]
+            deck_words = self.word_list[l:u]
 
             deck = AnkiDeck(
                 deck_name=f"{self.filename} - {deck_n}",
@@ -336,156 +709,306 @@ class AiSprachMeister:
 
             _ = deck.save(media)
 
-    def _generate_descriptive_and_example_senteces_for_word(
-        self, word: str, force: bool
+    def _generate_batch(
+        self,
+        words: List,
+        batch_size: int,
+        combined: bool,
+        obscure: bool = True,
+        obscure_engine: str = "spacy",
     ):
-        w = word.word
-        t = word.type
-        if not force and self.puzzler.is_duplicate(w):
-            return None
-
-        trans = self.prompt.translate(self.llm, w, t)
-        if not trans:
-            return None
-
-        w_en = trans["English"]
-        descriptive = self.prompt.describe(self.llm, w, t, w_en)
-        example = self.prompt.example(self.llm, w, t, w_en)
-        if not descriptive or not example:
-            return None
-
-        return {
-            "word": w,
-            "entries": {
-                "word_trans": eng_helper.remove_article(w_en),
-                "1_fil": descriptive["German"],
-                "1_pzl": ger_helper.obscure_closest_word(
-                    descriptive["German"], ger_helper.remove_article(w)
-                ),
-                "1_trans": descriptive["English"],
-                "2_fil": example["German"],
-                "2_pzl": ger_helper.obscure_closest_word(
-                    example["German"], ger_helper.remove_article(w)
-                ),
-                "2_trans": example["English"],
-            },
+        processed_words, fallbacks = [], words
+        if combined:
+            processed_words, fallbacks = self._generate_combined_for_words(
+                words, batch_size
+            )
+
+        processed_words += self._generate_descriptive_and_example_senteces_for_words(
+            fallbacks, batch_size
+        )
+
+        if obscure:
+            self._obscure_entries(processed_words, engine=obscure_engine)
+
+        return processed_words, fallbacks if combined else []
+
+    def _obscure_entries(
+        self,
+        processed_words: List[Dict],
+        n_process: int = 1,
+        batch_size: int = 64,
+        engine: str = "spacy",
+    ) -> None:
+        # All puzzles of a batch go through spaCy together
+        tasks = [
+            (processed_word, pzl, fil)
+            for processed_word in processed_words
+            for pzl, fil in PUZZLE_COLUMNS.items()
+        ]
+        puzzles = ger_helper.obscure_closest_words(
+            [
+                (
+                    processed_word["entries"][fil],
+                    ger_helper.remove_article(processed_word["word"]),
+                )
+                for processed_word, _, fil in tasks
+            ],
+            n_process,
+            batch_size,
+            engine,
+        )
+
+        for (processed_word, pzl, _), puzzle in zip(tasks, puzzles):
+            processed_word["entries"][pzl] = puzzle
+
+    def _generate_combined_for_words(self, words: List, batch_size: int):
+        answers = self.prompt.translate_describe_and_example_batch(
+            self.llm, [(word.word, word.type) for word in words], batch_size
+        )
+
+        processed_words = [
+            self._build_entries(
+                word.word,
+                answer["English"],
+                answer["Descriptive"],
+                answer["Example"],
+            )
+            for word, answer in zip(words, answers)
+            if answer
+        ]
+        fallbacks = [word for word, answer in zip(words, answers) if not answer]
+
+        return processed_words, fallbacks
+
+    def _generate_descriptive_and_example_senteces_for_words(
+        self, words: List, batch_size: int
+    ) -> List[Dict]:
+        translations = self.prompt.translate_batch(
+            self.llm, [(word.word, word.type) for word in words], batch_size
+        )
+        translated = [
+            (word, trans["English"])
+            for word, trans in zip(words, translations)
+            if trans
+        ]
+
+        sentences = self.prompt.describe_and_example_batch(
+            self.llm,
+            [(word.word, word.type, w_en) for word, w_en in translated],
+            batch_size,
+        )
+
+        return [
+            self._build_entries(word.word, w_en, descriptive, example)
+            for (word, w_en), (descriptive, example) in zip(translated, sentences)
+            if descriptive and example
+        ]
+
+    def _build_entries(self, w: str, w_en: str, descriptive: Dict, example: Dict):
+        entries = {
+            "word_trans": eng_helper.remove_article(w_en),
+            "1_fil": descriptive["German"],
+            "1_trans": descriptive["English"],
+            "2_fil": example["German"],
+            "2_trans": example["English"],
         }
 
-    def _store_progress(self, index, interval: int = 25):
-        if (index + 1) % interval == 0 or index + 1 == len(self.word_list):
+        return {"word": w, "entries": entries}
+
+    def _pipeline_source(
+        self,
+        pending: List[PlannedWord],
+        rest: List[PlannedWord],
+        batch_size: int,
+        combined: bool,
+    ):
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start : start + batch_size]
+            processed_words, _ = self._generate_batch(
+                batch, batch_size, combined, obscure=False
+            )
+
+            with self._puzzler_lock:
+                for processed_word in processed_words:
+                    self.puzzler.upsert(
+                        processed_word["word"], processed_word["entries"]
+                    )
+
+            processed = {processed_word["word"] for processed_word in processed_words}
+            yield from (
+                (word.position, word) for word in batch if word.word in processed
+            )
+
+        # Words generated by earlier runs may still miss puzzles, voices or mp3s
+        yield from ((word.position, word) for word in rest)
+
+    def _mp3_files(self) -> pd.Index:
+        # Listing a directory of a few hundred thousand voices is the slowest
+        # part of a plan, the listing and the hash table of its Index are
+        # reused until the directory changes
+        dir_path = io_helper.create_package_directory(self.filename)
+        mtime = os.stat(dir_path).st_mtime_ns
+        if self._mp3_listing is None or self._mp3_listing[0] != mtime:
+            self._mp3_listing = (mtime, pd.Index(os.listdir(dir_path), dtype=object))
+        return self._mp3_listing[1]
+
+    def _store_progress(self, start, end, interval: int = 25):
+        if start // interval != end // interval:
             self.puzzler.store(self.filename)
 
-    def _fetch_extra_verb_info(self):
-        for word in tqdm(self.word_list):
-            w = word.word
-            t = word.type
-
-            if t != VERB_TYPE.name:
-                continue
-
-            row = self.puzzler.get_values(key=w, columns=["expl_1"])
-
-            if (
-                row
-                and "expl_1" in row
-                and row["expl_1"] is not None
-                and row["expl_1"].strip() != ""
-                and row["expl_1"].strip() != "{}"
-            ):
-                continue
-
-            if len(w) > 1:
-                w_updated = w.replace("sich", "")
-                w_updated_split = w_updated.split()
-                if (
-                    len(w_updated_split) > 1
-                    and w_updated_split[-1] in ger_helper.VERB_PREFIXES
-                ):
-                    w_updated = "".join([w_updated_split[-1], w_updated_split[0]])
-            else:
-                w_updated = w
+    def _fetch_extra_verb_info(
+        self,
+        fetcher: AsyncFetcher,
+        chunk_size: int,
+        reparse: bool,
+        store: InflectionStore,
+    ):
+        verbs = {
+            word.word: _reverso_verb(word.word)
+            for word in _plan_words(
+                self.plan(reparse, ["conjugation"])["conjugation"]
+            )
+        }
+
+        words = list(verbs)
+        if not reparse:
+            words = self._fill_from_store(store, VERB_TYPE.name, words)
+
+        for start in range(0, len(words), chunk_size):
+            chunk = words[start : start + chunk_size]
+            conjugations = ger_helper.fetch_conjugations_from_reverso(
+                {verbs[w] for w in chunk}, fetcher, reparse
+            )
 
-            expl_1 = ger_helper.get_conjugation_from_reverso(w_updated)
+            self.puzzler.upsert_many(
+                {
+                    w: {"expl_1": conjugations[verbs[w]]}
+                    for w in chunk
+                    if verbs[w] in conjugations
+                }
+            )
 
-            self.puzzler.upsert(key_value=w, entries={"expl_1": expl_1})
             self.puzzler.store(self.filename)
 
-            sleep_time = int(random.uniform(1, 5))
-            time.sleep(sleep_time)
+    def _fetch_extra_noun_info(
+        self,
+        fetcher: AsyncFetcher,
+        chunk_size: int,
+        reparse: bool,
+        store: InflectionStore,
+    ):
+        nouns = [
+            word.word
+            for word in _plan_words(self.plan(reparse, ["declension"])["declension"])
+        ]
 
-        self.puzzler.store(self.filename)
+        if not reparse:
+            nouns = self._fill_from_store(store, NOUN_TYPE.name, nouns)
 
-    def _fetch_extra_noun_info(self):
-        for word in tqdm(self.word_list):
-            w = word.word
-            t = word.type
+        for start in range(0, len(nouns), chunk_size):
+            declensions = ger_helper.fetch_declensions_from_collinsdictionary(
+                nouns[start : start + chunk_size], fetcher, reparse
+            )
 
-            if t != NOUN_TYPE.name:
-                continue
+            self.puzzler.upsert_many(
+                {w: {"expl_1": expl_1} for w, expl_1 in declensions.items() if expl_1}
+            )
 
-            row = self.puzzler.get_values(key=w, columns=["expl_1"])
+            self.puzzler.store(self.filename)
 
-            if row and "expl_1" in row and row["expl_1"]:
-                try:
-                    extra_info = json.loads(row["expl_1"].strip())
-                    if extra_info and "Nominative" in extra_info:
-                        continue
-                except Exception:
-                    pass
+    def _fill_from_store(
+        self, store: InflectionStore, kind: str, words: List[str]
+    ) -> List[str]:
+        inflections = store.get_many(kind, words)
 
-            expl_1 = ger_helper.get_declension_info_from_collinsdictionary(w)
-            if expl_1:
-                self.puzzler.upsert(key_value=w, entries={"expl_1": expl_1})
-                self.puzzler.store(self.filename)
+        self.puzzler.upsert_many(
+            {w: {"expl_1": expl_1} for w, expl_1 in inflections.items()}
+        )
 
-                sleep_time = round(random.uniform(0.2, 3), 1)
-                time.sleep(sleep_time)
+        if inflections:
+            self.puzzler.store(self.filename)
 
-        self.puzzler.store(self.filename)
+        return [w for w in words if w not in inflections]
 
     def _generate_voices(
-        self, language, dir_path, columns, force, additional_text_callback=None
+        self,
+        language,
+        dir_path,
+        columns,
+        force,
+        additional_text_callback=None,
+        tasks: Optional[List[Tuple[PlannedWord, str]]] = None,
     ):
-        with TTSV2(language, dir_path) as tts:
-            for i, word in enumerate(tqdm(self.word_list)):
-                w = word.word
-                t = word.type
+        tasks = tasks if tasks is not None else self.plan(force, ["voice"])["voice"]
+        words = _plan_words([task for task in tasks if task[1] in columns])
+        if not words:
+            return
 
-                row = self.puzzler.get_values(
-                    key=w,
-                    columns=columns,
-                )
+        with self.t2s(language, dir_path) as tts:
+            for word in tqdm(words):
+                if self._voice_word(
+                    tts, word.position, word, columns, force, additional_text_callback
+                ):
+                    self.puzzler.store(self.filename)
 
-                voice_needed = any(not row.get(col) for col in columns if "vce" in col)
-                if not force and row and not voice_needed:
-                    continue
+    def _voice_word(
+        self, tts, i, word, columns, force, additional_text_callback=None
+    ) -> bool:
+        w = word.word
+        t = word.type
 
-                filenames = {
-                    col: _gen_random_wav_filename(i) for col in columns if "vce" in col
-                }
-                additional_texts = (
-                    additional_text_callback(row, t) if additional_text_callback else {}
-                )
-                self._handle_single_row_to_voice(
-                    row, w, tts, filenames, additional_texts
-                )
+        with self._puzzler_lock:
+            row = self.puzzler.get_values(key=w, columns=columns)
 
-                self.puzzler.store(self.filename)
+        if not row:
+            return False
+
+        voice_needed = any(not row.get(col) for col in columns if "vce" in col)
+        if not force and not voice_needed:
+            return False
+
+        filenames = {
+            col: _gen_random_wav_filename(i) for col in columns if "vce" in col
+        }
+        additional_texts = (
+            additional_text_callback(row, t) if additional_text_callback else {}
+        )
+        return self._handle_single_row_to_voice(
+            row, w, tts, filenames, additional_texts, force
+        )
 
     def _handle_single_row_to_voice(
-        self, row, w, tts, filenames, additional_texts=None
-    ):
+        self, row, w, tts, filenames, additional_texts=None, force=False
+    ) -> bool:
         if additional_texts is None:
             additional_texts = {}
+
+        voiced = False
         for key, filename in filenames.items():
-            text_key = key.split("_")[0]
+            text_key = key.removesuffix("_vce")
             if row.get(text_key):
                 text = row[text_key]
                 if text_key in additional_texts:
                     text = additional_texts[text_key] + text
-                if not row.get(filename):
+                if force or not row.get(key):
                     _ = tts.shoot(text, filename)
-                    self.puzzler.upsert(key_value=w, entries={filename: filename})
+                    with self._puzzler_lock:
+                        self.puzzler.upsert(key_value=w, entries={key: filename})
+                    voiced = True
+
+        return voiced
+
+    def _convert_word_to_mp3(self, w, dir_path) -> bool:
+        with self._puzzler_lock:
+            row = self.puzzler.get_values(key=w, columns=VOICE_COLUMNS)
+
+        if not row:
+            return False
+
+        for vce_filename in filter(None, row.values()):
+            self._convert_single_wav_file_to_mp3(vce_filename, dir_path)
+
+        return True
 
     def _convert_single_wav_file_to_mp3(self, vce_filename, dir_path):
         filepath = os.path.join(dir_path, vce_filename)
@@ -495,12 +1018,32 @@ class AiSprachMeister:
             return
 
         try:
+            from pydub import AudioSegment
+
             mp3 = AudioSegment.from_wav(filepath)
             mp3.export(mp3_path, format="mp3", bitrate="32k")
         except Exception as e:
             print(f"Error converting {vce_filename} to mp3: {e}")
 
 
+def _autocast():
+    # torch is only imported once the models are about to run
+    import torch
+
+    return torch.autocast(
+        "cuda", dtype=torch.bfloat16, enabled=torch.cuda.is_available()
+    )
+
+
+def _has_both_sentences(result: Dict) -> bool:
+    return all(
+        isinstance(result[key], dict)
+        and result[key].get("German")
+        and result[key].get("English")
+        for key in ["Descriptive", "Example"]
+    )
+
+
 def _expl_to_string(expl_1_str: str, word_type: str) -> str:
     try:
         if word_type not in ["Noun", "Verb"]:
@@ -516,5 +1059,104 @@ def _expl_to_string(expl_1_str: str, word_type: str) -> str:
         return ""
 
 
+def _has_conjugation(expl_1: Optional[str]) -> bool:
+    return (
+        expl_1 is not None
+        and expl_1.strip() != ""
+        and expl_1.strip() != "{}"
+    )
+
+
+def _has_declension(expl_1: Optional[str]) -> bool:
+    if not expl_1:
+        return False
+
+    try:
+        extra_info = json.loads(expl_1.strip())
+        return bool(extra_info) and "Nominative" in extra_info
+    except Exception:
+        return False
+
+
+class _AlignedColumns:
+    # Puzzler columns aligned with the words of a plan, "" where a word has no
+    # row. Only the columns a stage asks for are read from a lazy file
+    def __init__(self, puzzler: TwoSentencePuzzlerDataFrame, rows: np.ndarray):
+        self.puzzler = puzzler
+        self.rows = rows
+        self._values: Dict[str, pd.Series] = {}
+        self._filled: Dict[str, np.ndarray] = {}
+
+    def has_row(self) -> np.ndarray:
+        return self.rows >= 0
+
+    def __getitem__(self, name: str) -> pd.Series:
+        if name not in self._values:
+            # Taken in the column's own dtype, the -1 of words without a row
+            # becomes a missing value
+            values = self.puzzler.column_values(name).array
+            aligned = pd.Series(values.take(self.rows, allow_fill=True))
+            self._values[name] = aligned.fillna("")
+        return self._values[name]
+
+    def filled(self, name: str) -> np.ndarray:
+        if name not in self._filled:
+            self._filled[name] = (self[name].str.len() > 0).to_numpy(dtype=bool)
+        return self._filled[name]
+
+
+def _conjugation_mask(expl_1: pd.Series) -> np.ndarray:
+    return (~expl_1.isin(["", "{}"])).to_numpy()
+
+
+def _declension_mask(expl_1: pd.Series) -> np.ndarray:
+    # The declensions are stored with json.dumps, so a leading brace and the
+    # quoted key stand in for parsing every value with _has_declension
+    return (
+        expl_1.str.startswith("{") & expl_1.str.contains('"Nominative"', regex=False)
+    ).to_numpy(dtype=bool)
+
+
+def _plan_words(
+    tasks: List[Tuple[PlannedWord, str]], exclude: Optional[set] = None
+) -> List[PlannedWord]:
+    words = dict.fromkeys(word for word, _ in tasks)
+    return sorted(
+        (word for word in words if not exclude or word.word not in exclude),
+        key=lambda word: word.position,
+    )
+
+
+def _reverso_verb(w: str) -> str:
+    # Reverso expects separable verbs with their prefix attached
+    if len(w) > 1:
+        w_updated = w.replace("sich", "")
+        w_updated_split = w_updated.split()
+        if (
+            len(w_updated_split) > 1
+            and w_updated_split[-1] in ger_helper.VERB_PREFIXES
+        ):
+            w_updated = "".join([w_updated_split[-1], w_updated_split[0]])
+    else:
+        w_updated = w
+
+    return w_updated
+
+
+def _german_additional_texts(row, word_type):
+    expl_1_processed = (
+        _expl_to_string(row.get("expl_1"), word_type) if row.get("expl_1") else ""
+    )
+    return {
+        "1_fil": f"{row['word'] + '.' if not expl_1_processed else ''}{expl_1_processed}",
+    }
+
+
+def _english_additional_texts(row, _):
+    return {
+        "1_trans": f"{row['word_trans']}. " if row.get("word_trans") else "",
+    }
+
+
 def _gen_random_wav_filename(i: int) -> str:
     return f"{i:05}-{uuid.uuid4()}.wav"
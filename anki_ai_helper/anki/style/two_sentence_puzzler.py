@@ -1,7 +1,8 @@
-from typing import ClassVar, Dict, List
+from typing import ClassVar, Dict, List, Optional
 
 from anki_ai_helper.anki.interface import AnkiTemplate, AnkiNote
-from anki_ai_helper.helper.dataframe import GenericDataFrame
+from anki_ai_helper.helper.dataframe import STRING_DTYPE, GenericDataFrame
+from anki_ai_helper.helper.storage import FrameStorage
 
 
 class TwoSentencePuzzlerDataFrame(GenericDataFrame):
@@ -24,8 +25,13 @@ class TwoSentencePuzzlerDataFrame(GenericDataFrame):
         "expl_2": str,  # Extra explanation
     }
 
-    def __init__(self):
-        super().__init__(self.COLUMNS, "word")
+    def __init__(self, storage: Optional[FrameStorage] = None):
+        super().__init__(
+            self.COLUMNS,
+            "word",
+            storage,
+            dtypes={column: STRING_DTYPE for column in self.COLUMNS},
+        )
 
 
 class TwoSentencePuzzlerFields:
@@ -1,12 +1,11 @@
 import pandas as pd
 
-from typing import Iterator, List, Dict
+from typing import List, Dict
 
 from .interface import (
     WordList,
     WordType,
     WordListDF,
-    WordListRow,
     NOUN_TYPE,
     VERB_TYPE,
     OTHER_TYPE,
@@ -21,12 +20,5 @@ class DictWordList(WordList):
         }
         self.df: WordListDF = pd.DataFrame(data)
 
-    def __iter__(self) -> Iterator[WordListRow]:
-        for _, row in self.df.iterrows():
-            yield row
-
-    def __len__(self) -> int:
-        return len(self.df)
-
     def get_types(self) -> List[WordType]:
         return [NOUN_TYPE, VERB_TYPE, OTHER_TYPE]
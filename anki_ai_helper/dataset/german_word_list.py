@@ -1,13 +1,12 @@
 import os
 import pandas as pd
 
-from typing import Iterator, List
+from typing import List
 
 from .interface import (
     WordList,
     WordType,
     WordListDF,
-    WordListRow,
     NOUN_TYPE,
     VERB_TYPE,
     OTHER_TYPE,
@@ -22,12 +21,5 @@ class GermanWordList(WordList):
         if f != 0 or t != -1:
             self.df = self.df[f:t]
 
-    def __iter__(self) -> Iterator[WordListRow]:
-        for _, row in self.df.iterrows():
-            yield row
-
-    def __len__(self) -> int:
-        return len(self.df)
-
     def get_types(self) -> List[WordType]:
         return [NOUN_TYPE, VERB_TYPE, OTHER_TYPE]
@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import Iterator, List
+from typing import Iterator, List, Optional, Union
 from typing_extensions import Protocol
 import pandas as pd
 
@@ -24,6 +24,24 @@ class WordListRow(Protocol):
         ...
 
 
+class WordListEntry:
+    # Iterating a pandas frame row by row builds a Series per row, these are
+    # built once from the column arrays instead
+    __slots__ = ("word", "type")
+
+    def __init__(self, word: str, type: str) -> None:
+        self.word = word
+        self.type = type
+
+    def __getitem__(self, column: str):
+        if column not in self.__slots__:
+            raise KeyError(column)
+        return getattr(self, column)
+
+    def __repr__(self) -> str:
+        return f"WordListEntry(word={self.word!r}, type={self.type!r})"
+
+
 class WordListDF(Protocol):
     @property
     def word(self) -> pd.Series:
@@ -35,17 +53,40 @@ class WordListDF(Protocol):
 
 
 class WordList(ABC):
-    @abstractmethod
+    df: WordListDF
+
     def __iter__(self) -> Iterator[WordListRow]:
-        ...
+        return iter(self.to_list())
 
-    @abstractmethod
     def __len__(self) -> int:
-        ...
+        return len(self.df)
+
+    def __getitem__(
+        self, index: Union[int, slice]
+    ) -> Union[WordListRow, List[WordListRow]]:
+        # A slice of a list that isn't built yet only builds the rows it needs
+        if isinstance(index, slice) and self._cached_rows() is None:
+            return _build_rows(self.df[index])
+        return self.to_list()[index]
 
     @abstractmethod
     def get_types(self) -> List[WordType]:
         ...
 
     def to_list(self) -> List[WordListRow]:
-        return [row for _, row in self.df.iterrows()]
+        rows = self._cached_rows()
+        if rows is None:
+            rows = _build_rows(self.df)
+            self._rows = (self.df, rows)
+        return rows
+
+    def _cached_rows(self) -> Optional[List[WordListRow]]:
+        # The cache belongs to the frame it was built from
+        cached = getattr(self, "_rows", None)
+        if cached is None or cached[0] is not self.df:
+            return None
+        return cached[1]
+
+
+def _build_rows(df: WordListDF) -> List[WordListEntry]:
+    return list(map(WordListEntry, df["word"].tolist(), df["type"].tolist()))
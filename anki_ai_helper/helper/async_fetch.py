@@ -0,0 +1,184 @@
+import asyncio
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import urlsplit
+
+import aiohttp
+from tqdm import tqdm
+
+from anki_ai_helper.helper.http_cache import CachedPage, HttpCache
+
+
+# Responses worth another attempt, everything else is final
+RETRY_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AsyncFetcher:
+    def __init__(
+        self,
+        concurrency: int = 8,
+        rate_per_host: float = 1.0,
+        burst: int = 2,
+        retries: int = 3,
+        backoff: float = 1.0,
+        timeout: float = 30.0,
+        headers: Optional[Dict[str, str]] = None,
+        progress: bool = True,
+        cache: Optional[HttpCache] = None,
+        offline: bool = False,
+    ):
+        self.concurrency = concurrency
+        self.rate_per_host = rate_per_host
+        self.burst = burst
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.headers = headers
+        self.progress = progress
+        self.cache = cache
+        self.offline = offline
+
+    def fetch(self, urls: Iterable[str]) -> Dict[str, Optional[str]]:
+        return run_sync(self.fetch_all(urls))
+
+    async def fetch_all(self, urls: Iterable[str]) -> Dict[str, Optional[str]]:
+        urls = list(dict.fromkeys(urls))
+        if not urls:
+            return {}
+
+        if self.offline:
+            return {url: self._offline_page(url) for url in urls}
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        buckets: Dict[str, TokenBucket] = {}
+
+        session = aiohttp.ClientSession(
+            headers=self.headers,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            connector=aiohttp.TCPConnector(limit=self.concurrency),
+        )
+
+        with tqdm(total=len(urls), disable=not self.progress) as progress:
+            async with session:
+                pages: List[Optional[str]] = await asyncio.gather(
+                    *[
+                        self._fetch(session, semaphore, buckets, url, progress)
+                        for url in urls
+                    ]
+                )
+
+        return dict(zip(urls, pages))
+
+    async def _fetch(self, session, semaphore, buckets, url, progress) -> Optional[str]:
+        host = urlsplit(url).netloc
+        if host not in buckets:
+            buckets[host] = TokenBucket(self.rate_per_host, self.burst)
+
+        cached = self.cache.get(url) if self.cache is not None else None
+
+        try:
+            # Fresh pages neither hit the network nor spend the host's budget
+            if cached is not None and cached.is_fresh(self.cache.ttl):
+                self.cache.hits += 1
+                return cached.body if cached.status < 400 else None
+
+            async with semaphore:
+                return await self._fetch_with_retries(
+                    session, buckets[host], url, cached
+                )
+        finally:
+            progress.update(1)
+
+    async def _fetch_with_retries(
+        self, session, bucket, url, cached: Optional[CachedPage]
+    ) -> Optional[str]:
+        headers = cached.validators() if cached is not None else None
+
+        for attempt in range(self.retries + 1):
+            await bucket.acquire()
+
+            try:
+                async with session.get(url, headers=headers) as response:
+                    if response.status == 304 and cached is not None:
+                        self.cache.revalidated += 1
+                        self.cache.touch(url)
+                        return cached.body if cached.status < 400 else None
+
+                    if response.status < 400:
+                        body = await response.text()
+                        self._store(url, response, body)
+                        return body
+
+                    if response.status not in RETRY_STATUSES:
+                        # Missing words are remembered so reruns skip them
+                        self._store(url, response, None)
+                        return None
+
+                    error = f"HTTP {response.status}"
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = f"{type(e).__name__}: {e}"
+
+            if attempt < self.retries:
+                delay = self.backoff * 2**attempt
+                await asyncio.sleep(delay + random.uniform(0, delay))
+
+        print(f"Unable to fetch {url} after {self.retries + 1} attempts. Error: {error}")
+        return None
+
+    def _store(self, url: str, response, body: Optional[str]) -> None:
+        if self.cache is None:
+            return
+
+        self.cache.misses += 1
+        self.cache.put(
+            url,
+            response.status,
+            body,
+            response.headers.get("ETag"),
+            response.headers.get("Last-Modified"),
+        )
+
+    def _offline_page(self, url: str) -> Optional[str]:
+        cached = self.cache.get(url) if self.cache is not None else None
+        if cached is None:
+            return None
+
+        self.cache.hits += 1
+        return cached.body if cached.status < 400 else None
+
+
+def run_sync(coroutine):
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+
+    # Jupyter already runs an event loop in this thread
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coroutine).result()
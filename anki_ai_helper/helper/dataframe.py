@@ -1,14 +1,19 @@
+import importlib.util
 import pandas as pd
 import numpy as np
-from typing import Type, TypeVar, Dict, Any
-import os
-import shutil
+from typing import Type, TypeVar, Dict, Any, List, Optional, Tuple
 from datetime import datetime
 
-from .io import create_package_directory
+from .storage import FrameStorage, ParquetJournalStorage
 
 T = TypeVar("T")
 
+# Arrow backed strings avoid one boxed Python object per cell, pandas
+# imports pyarrow itself once such a column is created
+STRING_DTYPE = (
+    "string[pyarrow]" if importlib.util.find_spec("pyarrow") is not None else "object"
+)
+
 
 class SchemaMismatchError(Exception):
     pass
@@ -19,18 +24,63 @@ class ColumnTypeError(Exception):
 
 
 class GenericDataFrame:
-    df: pd.DataFrame
-
-    def __init__(self, column_types: Dict[str, Type], key_column: str):
+    def __init__(
+        self,
+        column_types: Dict[str, Type],
+        key_column: str,
+        storage: Optional[FrameStorage] = None,
+        dtypes: Optional[Dict[str, str]] = None,
+    ):
         self.column_types = column_types
         self.key_column = key_column
+        # The pandas dtype of each column, the Python type decides unless the
+        # policy asks for e.g. STRING_DTYPE or "category"
+        self.dtypes = {
+            col: self.map_type_to_pandas(ptype) for col, ptype in column_types.items()
+        }
+        self.dtypes.update(dtypes or {})
+        self.storage = storage if storage is not None else ParquetJournalStorage()
+        self._default_row = {
+            col: self.get_default_value(ptype)
+            for col, ptype in self.column_types.items()
+        }
         self.df = self.create_empty_dataframe()
 
+    @property
+    def df(self) -> pd.DataFrame:
+        self._flush()
+        return self._df
+
+    @df.setter
+    def df(self, df: pd.DataFrame) -> None:
+        # Maps every key to its row position, the first occurrence wins
+        self._df = df
+        keys = df[self.key_column].tolist()
+        self._positions: Dict[Any, int] = dict(
+            zip(reversed(keys), range(len(keys) - 1, -1, -1))
+        )
+        self._key_index: Optional[Tuple[pd.Index, np.ndarray]] = None
+
+        # Writes are collected here and applied to the frame in one go on
+        # the next read of df, which includes store()
+        self._new_rows: Dict[Any, Dict[str, Any]] = {}
+        self._updates: Dict[Any, Dict[str, Any]] = {}
+
+        # Entries written since the last store(). Replacing the whole frame
+        # can't be stored row by row, so it forces a full rewrite
+        self._dirty: Dict[Any, Dict[str, Any]] = {}
+        self._needs_rewrite = True
+
+        # Stored columns that are read on first use, see load_and_append
+        self._lazy_source: Optional[str] = None
+        self._lazy_columns: List[str] = []
+        self._column_order: List[str] = list(df.columns)
+
     def create_empty_dataframe(self) -> pd.DataFrame:
         return pd.DataFrame(
             {
-                col: pd.Series(dtype=self.map_type_to_pandas(ptype))
-                for col, ptype in self.column_types.items()
+                col: pd.Series(dtype=self.dtypes[col])
+                for col in self.column_types
             }
         )
 
@@ -52,68 +102,201 @@ class GenericDataFrame:
         if set(data.columns) != set(self.column_types.keys()):
             raise SchemaMismatchError("DataFrame schema does not match expected schema")
 
-        for column, expected_type in self.column_types.items():
-            if not pd.api.types.is_dtype_equal(
-                data[column].dtype, pd.Series([0], dtype=expected_type).dtype
-            ):
+        for column in self.column_types:
+            if not _is_compatible(data[column].dtype, self.dtypes[column]):
                 raise ColumnTypeError(f"Column {column} type mismatch")
 
-    def load_and_append(self, filename: str) -> None:
-        full_path = self._gen_path(filename)
+    def apply_dtypes(self, data: pd.DataFrame) -> pd.DataFrame:
+        casts = {
+            column: dtype
+            for column, dtype in self.dtypes.items()
+            if column in data.columns
+            and not pd.api.types.is_dtype_equal(data[column].dtype, dtype)
+        }
+        return data.astype(casts) if casts else data
 
-        if not os.path.exists(full_path):
-            return
+    def memory_usage(self) -> Dict[str, int]:
+        return self.df.memory_usage(deep=True, index=False).to_dict()
 
-        loaded_df = pd.read_parquet(full_path)
+    def load_and_append(self, filename: str) -> None:
+        schema = self.storage.schema(self, filename)
+        if schema is not None:
+            self.validate_schema(schema)
+
+        # An empty frame only reads the key column now, the rest is read
+        # column by column when first asked for
+        lazy = schema is not None and self.is_empty()
+        loaded_df, records = self.storage.load(
+            self, filename, [self.key_column] if lazy else None
+        )
+
+        if loaded_df is not None:
+            loaded_df = self.apply_dtypes(loaded_df)
+
+        if loaded_df is not None and lazy:
+            self.df = loaded_df
+            self._lazy_source = filename
+            self._lazy_columns = [c for c in schema.columns if c != self.key_column]
+            self._column_order = list(schema.columns)
+            self._needs_rewrite = False
+        elif loaded_df is not None:
+            was_empty = self.is_empty()
+
+            self.validate_schema(loaded_df)
+            self.df = (
+                loaded_df
+                if was_empty
+                else pd.concat([self.df, loaded_df], ignore_index=True)
+            )
+
+            self._needs_rewrite = not was_empty
+
+        for key, entries in records:
+            self.upsert_many({key: entries})
+        self._dirty = {}
+
+    def import_parquet(self, path: str) -> None:
+        loaded_df = pd.read_parquet(path)
         self.validate_schema(loaded_df)
         self.df = pd.concat([self.df, loaded_df], ignore_index=True)
 
+    def export_parquet(self, path: str) -> None:
+        self.df.to_parquet(path)
+
+    def is_empty(self) -> bool:
+        return not self._positions and not self._new_rows
+
     def is_duplicate(self, key: Any) -> bool:
-        return key in self.df[self.key_column].values
+        return key in self._positions or key in self._new_rows
 
     def add_row(self, row_data: Dict[str, Any], force: bool = False) -> None:
         if not isinstance(row_data, dict):
             raise TypeError("row_data must be a dictionary")
 
-        key_exists = row_data[self.key_column] in self.df[self.key_column]
+        key = row_data[self.key_column]
+        key_exists = self.is_duplicate(key)
         if key_exists and not force:
             raise ValueError("Duplicate key has been found")
 
         self.validate_schema(pd.DataFrame([row_data]))
 
-        new_row = pd.DataFrame([row_data])
         if key_exists and force:
-            index = self.df[self.df[self.key_column] == row_data[self.key_column]].index
-            self.df.loc[index] = new_row
-        else:
-            self.df = pd.concat([self.df, new_row], ignore_index=True)
-
-    def upsert(self, key: str, entries: dict):
-        if self.is_duplicate(key):
-            self.df.loc[
-                self.df[self.key_column] == key, entries.keys()
-            ] = entries.values()
+            self.upsert_many({key: row_data})
         else:
-            new_row = pd.DataFrame([{self.key_column: key, **entries}])
-            self.df = pd.concat([self.df, new_row], ignore_index=True)
+            self._new_rows[key] = dict(row_data)
+            self._key_index = None
+            self._dirty[key] = dict(row_data)
 
     def get_values(self, key: str, columns: list):
-        if key not in self.df[self.key_column].values:
+        if self._lazy_columns:
+            self._load_columns(columns)
+
+        if key in self._new_rows:
+            row = self._new_rows[key]
+            return {column: row.get(column, np.nan) for column in columns}
+
+        position = self._positions.get(key)
+        if position is None:
             return None
 
-        row = self.df.loc[self.df[self.key_column] == key, columns]
-        return row.to_dict(orient="records")[0]
+        # Indexing the column's array skips the frame level checks of iat,
+        # which cost several times more on arrow strings
+        updates = self._updates.get(key, {})
+        return {
+            column: updates[column]
+            if column in updates
+            else _missing_to_none(self._df[column].array[position])
+            for column in columns
+        }
+
+    def get_column(self, column: str) -> Dict[Any, Any]:
+        # Iterating arrow backed columns boxes every cell separately. Reversed
+        # so the first row of a repeated key wins, like in get_values
+        return dict(
+            zip(
+                self.key_array()[::-1],
+                map(
+                    _missing_to_none,
+                    self.column_values(column).to_numpy(dtype=object)[::-1],
+                ),
+            )
+        )
+
+    def key_array(self) -> np.ndarray:
+        # The keys in row order, rows still in the write buffer last. Like
+        # column_values, it doesn't flush the buffer or load lazy columns
+        keys = self._df[self.key_column].to_numpy(dtype=object)
+        if not self._new_rows:
+            return keys
+        return np.concatenate([keys, np.array(list(self._new_rows), dtype=object)])
+
+    def column_values(self, column: str) -> pd.Series:
+        # The column with the buffered writes applied, aligned with key_array.
+        # It keeps the column's dtype, so string checks stay vectorized
+        if self._lazy_columns:
+            self._load_columns([column])
+
+        if column in self._df.columns:
+            values = self._df[column].reset_index(drop=True)
+        else:
+            values = pd.Series(np.nan, index=range(len(self._df)), dtype=object)
+
+        updates = {
+            self._positions[key]: entries[column]
+            for key, entries in self._updates.items()
+            if column in entries
+        }
+        if updates:
+            values = _set_positions(values, list(updates), list(updates.values()))
+
+        if self._new_rows:
+            dtype = (
+                object if isinstance(values.dtype, pd.CategoricalDtype) else values.dtype
+            )
+            new_values = pd.Series(
+                [row.get(column, np.nan) for row in self._new_rows.values()],
+                dtype=dtype,
+            )
+            values = pd.concat([values, new_values], ignore_index=True)
+
+        return values
+
+    def key_index(self) -> pd.Index:
+        # Every key once, kept with its hash table until a row is added. The
+        # same object is returned as long as locate() gives the same answers
+        if self._key_index is None:
+            start = len(self._df)
+            index = pd.Index([*self._positions, *self._new_rows], dtype=object)
+            positions = np.fromiter(
+                (
+                    *self._positions.values(),
+                    *range(start, start + len(self._new_rows)),
+                ),
+                dtype=np.int64,
+                count=len(index),
+            )
+            self._key_index = (index, positions)
+        return self._key_index[0]
+
+    def locate(self, keys: Any) -> np.ndarray:
+        # Positions of the keys in key_array and column_values, -1 for keys
+        # without a row. The first row of a repeated key wins, like in get_values
+        index = self.key_index()
+        # get_indexer returns -1 for missing keys, which picks the trailing -1
+        positions = np.append(self._key_index[1], -1)
+        return positions[index.get_indexer(keys)]
 
     def update_cell(self, index: int, column_name: str, value: Any) -> None:
-        if column_name not in self.df.columns:
+        if column_name not in self.column_types:
             raise ValueError(f"Column {column_name} does not exist in DataFrame")
 
-        expected_type = self.get_column_types().get(column_name)
+        expected_type = self.column_types[column_name]
 
         if not isinstance(value, expected_type):
             raise TypeError(f"Value for {column_name} must be of type {expected_type}")
 
-        self.df.at[index, column_name] = value
+        # Goes through the write buffer so store() sees the cell as dirty
+        self.upsert(self.key_array()[index], {column_name: value})
 
     def get_default_value(self, python_type: Type):
         default_values = {
@@ -126,32 +309,109 @@ class GenericDataFrame:
         return default_values.get(python_type, np.nan)
 
     def upsert(self, key_value: str, entries: Dict[str, Any]) -> None:
-        if key_value not in self.df[self.key_column].values:
-            new_row = {
-                col: self.get_default_value(ptype)
-                for col, ptype in self.column_types.items()
-            }
-            new_row[self.key_column] = key_value
-
-            new_row_df = pd.DataFrame(new_row, index=[0])
-            self.df = pd.concat([self.df, new_row_df], ignore_index=True)
-
-        for col, value in entries.items():
-            self.df.loc[self.df[self.key_column] == key_value, col] = value
-
-    def store(self, filename: str) -> None:
-        full_path = self._gen_path(filename)
-        backup_directory = create_package_directory("parquet_backups")
-
-        if os.path.exists(full_path):
-            timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-            backup_filename = f"{os.path.splitext(filename)[0]}_{timestamp}.parquet"
-            backup_path = os.path.join(backup_directory, backup_filename)
-            shutil.move(full_path, backup_path)
+        self.upsert_many({key_value: entries})
+
+    def upsert_many(self, records: Dict[Any, Dict[str, Any]]) -> None:
+        for key, entries in records.items():
+            self._dirty.setdefault(key, {}).update(entries)
+
+            if key in self._new_rows:
+                self._new_rows[key].update(entries)
+            elif key in self._positions:
+                self._updates.setdefault(key, {}).update(entries)
+            else:
+                new_row = dict(self._default_row)
+                new_row[self.key_column] = key
+                new_row.update(entries)
+                self._new_rows[key] = new_row
+                self._key_index = None
+
+    def store(self, filename: str, compact: bool = False) -> None:
+        self.storage.store(
+            self, filename, self._dirty, compact or self._needs_rewrite
+        )
+        self._dirty = {}
+        self._needs_rewrite = False
 
-        self.df.to_parquet(full_path)
+    def _load_columns(self, columns: List[str]) -> None:
+        missing = [column for column in columns if column in self._lazy_columns]
+        if not missing:
+            return
 
-    def _gen_path(self, filename: str) -> str:
-        filename = f"{os.path.splitext(filename)[0]}.parquet"
-        parquet_directory = create_package_directory("parquets")
-        return os.path.join(parquet_directory, filename)
+        # The storage may already hold rows added after the load, they are
+        # still in the write buffer so only the loaded rows are taken
+        loaded = self.apply_dtypes(
+            self.storage.load_columns(self, self._lazy_source, missing)
+        )
+        for column in missing:
+            self._df[column] = loaded[column].values[: len(self._df)]
+            self._lazy_columns.remove(column)
+
+        if not self._lazy_columns:
+            self._df = self._df[self._column_order]
+
+    def _flush(self) -> None:
+        if self._lazy_columns:
+            self._load_columns(list(self._lazy_columns))
+
+        if self._updates:
+            columns: Dict[str, Tuple[List[int], List[Any]]] = {}
+            for key, entries in self._updates.items():
+                for col, value in entries.items():
+                    positions, values = columns.setdefault(col, ([], []))
+                    positions.append(self._positions[key])
+                    values.append(value)
+
+            for col, (positions, values) in columns.items():
+                if col not in self._df.columns:
+                    self._df[col] = np.nan
+
+                # Set through the column, frame level iloc fails on arrow strings
+                self._df[col] = _set_positions(self._df[col], positions, values)
+
+            self._updates = {}
+
+        if self._new_rows:
+            start = len(self._df)
+            new_rows = self.apply_dtypes(pd.DataFrame(list(self._new_rows.values())))
+            # Categoricals with different categories concatenate to object
+            self._df = self.apply_dtypes(
+                pd.concat([self._df, new_rows], ignore_index=True)
+            )
+            for i, key in enumerate(self._new_rows):
+                self._positions.setdefault(key, start + i)
+
+            self._new_rows = {}
+
+
+def _is_text(dtype) -> bool:
+    if isinstance(dtype, pd.CategoricalDtype):
+        # A plain "category" doesn't fix the type of its categories yet
+        return dtype.categories is None or _is_text(dtype.categories.dtype)
+    return pd.api.types.is_object_dtype(dtype) or pd.api.types.is_string_dtype(dtype)
+
+
+def _is_compatible(actual, expected) -> bool:
+    # Text may be stored as object, string or dictionary encoded columns,
+    # apply_dtypes converts it to the frame's policy after loading
+    expected = pd.api.types.pandas_dtype(expected)
+    return pd.api.types.is_dtype_equal(actual, expected) or (
+        _is_text(actual) and _is_text(expected)
+    )
+
+
+def _set_positions(
+    column: pd.Series, positions: List[int], values: List[Any]
+) -> pd.Series:
+    column = column.copy()
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        new = pd.Index(values).dropna().difference(column.cat.categories)
+        if len(new):
+            column = column.cat.add_categories(new)
+
+    column.iloc[positions] = values
+    return column
+
+
+def _missing_to_none(value: Any) -> Any:
+    return None if value is pd.NA else value
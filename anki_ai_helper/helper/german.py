@@ -1,11 +1,17 @@
+import functools
+import importlib.util
 import re
-import spacy
+import threading
 import requests
 import json
-from bs4 import BeautifulSoup
-from typing import Dict
+from bs4 import BeautifulSoup, SoupStrainer
+from typing import Callable, Dict, Iterable, List, Tuple
 import unicodedata
 
+import numpy as np
+
+from anki_ai_helper.helper.async_fetch import AsyncFetcher
+
 VERB_PREFIXES = [
     "ab",
     "an",
@@ -36,9 +42,98 @@ VERB_PREFIXES = [
     "los",
 ]
 
+# Only these are split off in main clauses ("fange ... an") and take the "ge"
+# of participles behind them ("angerufen"). "er", "ver", "be" etc. stay
+# attached, and some of them are also ordinary words like "er"
+SEPARABLE_VERB_PREFIXES = [
+    "ab",
+    "an",
+    "auf",
+    "aus",
+    "bei",
+    "ein",
+    "fest",
+    "fort",
+    "her",
+    "heim",
+    "hin",
+    "los",
+    "mit",
+    "nach",
+    "vor",
+    "vorbei",
+    "weg",
+    "weiter",
+    "zu",
+    "zurück",
+    "zusammen",
+]
+
+# Point these at a local server to test the scrapers offline
+REVERSO_URL = "https://conjugator.reverso.net/conjugation-german-verb-{verb}.html"
+COLLINS_URL = "https://www.collinsdictionary.com/dictionary/german-english/{word}"
+
+# Bump these when a parser changes so cached pages are parsed again
+REVERSO_PARSER = "reverso-conjugation-2"
+COLLINS_PARSER = "collins-declension-2"
+
+# Only these parts of the pages are built into a tree, the rest is skipped
+REVERSO_STRAINER = SoupStrainer("div", class_="wrap-three-col")
+COLLINS_STRAINER = SoupStrainer(
+    class_=["short_noun_table decl", "form inflected_forms type-infl"]
+)
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/89.0.4389.82 Safari/537.36",
+}
+
 # Run `python -m spacy download de_core_news_lg` to install the model
+GERMAN_NLP_MODEL = "de_core_news_lg"
+
+# Obscuring only needs tags, lemmas and vectors
+OBSCURE_DISABLED_PIPES = ["parser", "ner"]
+
+# "spacy" compares lemmas and vectors of de_core_news_lg, "rules" only needs
+# a stemmer and handles separable verbs with SEPARABLE_VERB_PREFIXES
+OBSCURE_ENGINES = ["spacy", "rules"]
+
+# Placeholders in the word list entries, e.g. "sich in jemand verlieben"
+_RULES_FILLER_WORDS = {"sich", "jemand", "jemanden", "jemandem", "etwas"}
+
+_german_nlp = None
+_german_nlp_lock = threading.Lock()
+
+# Target words repeat across sentences and runs, they are parsed once
+WORD_DOC_CACHE_SIZE = 50000
+
+_word_docs: Dict[str, object] = {}
+_word_docs_lock = threading.Lock()
+
+
+def german_nlp():
+    # The model takes seconds and ~500 MB to load, so it's only loaded on the
+    # first sentence that needs it instead of on import
+    global _german_nlp
+
+    with _german_nlp_lock:
+        if _german_nlp is None:
+            import spacy
+
+            _german_nlp = spacy.load(GERMAN_NLP_MODEL)
+
+    return _german_nlp
+
 
-_german_nlp = spacy.load("de_core_news_lg")
+def load_obscure_engine(engine: str = "spacy") -> None:
+    # Used as the initializer of worker processes, so each one loads the model
+    # once before its first task instead of inside it
+    if engine not in OBSCURE_ENGINES:
+        raise ValueError(f"Unknown obscuring engine: {engine}")
+
+    if engine == "spacy":
+        german_nlp()
+    else:
+        _german_stemmer()
 
 
 def remove_article(word: str) -> str:
@@ -51,44 +146,119 @@ def remove_article(word: str) -> str:
         return " ".join(words)
 
 
-def obscure_closest_word(sentence: str, word: str) -> str | None:
-    sentence_nlp = _german_nlp(sentence)
-    word_nlp = _german_nlp(word)[0]
+def obscure_closest_word(
+    sentence: str, word: str, engine: str = "spacy"
+) -> str | None:
+    return obscure_closest_words([(sentence, word)], engine=engine)[0]
+
+
+def obscure_closest_words(
+    pairs: Iterable[Tuple[str, str]],
+    n_process: int = 1,
+    batch_size: int = 64,
+    engine: str = "spacy",
+    nlp=None,
+) -> List[str | None]:
+    # Runs the sentences through nlp.pipe in batches, the target words come
+    # from a cache so each one is only parsed the first time it is seen.
+    # nlp replaces the de_core_news_lg pipeline, its words aren't cached
+    if engine not in OBSCURE_ENGINES:
+        raise ValueError(f"Unknown obscuring engine: {engine}")
+
+    pairs = list(pairs)
+    if not pairs:
+        return []
+
+    if engine == "rules":
+        return [_obscure_with_rules(sentence, word) for sentence, word in pairs]
+
+    words = list({word for _, word in pairs})
+    if nlp is None:
+        nlp = german_nlp()
+        word_docs = _parse_words(words, n_process, batch_size)
+    else:
+        word_docs = dict(
+            zip(
+                words,
+                nlp.pipe(
+                    words,
+                    batch_size=batch_size,
+                    n_process=n_process,
+                    disable=OBSCURE_DISABLED_PIPES,
+                ),
+            )
+        )
+    sentence_docs = nlp.pipe(
+        (sentence for sentence, _ in pairs),
+        batch_size=batch_size,
+        n_process=n_process,
+        disable=OBSCURE_DISABLED_PIPES,
+    )
 
-    target_is_verb = word_nlp.pos_ == "VERB"
-    target_is_noun = word_nlp.pos_ == "NOUN"
+    return [
+        _obscure(sentence_nlp, word_docs[word], sentence, word)
+        for sentence_nlp, (sentence, word) in zip(sentence_docs, pairs)
+    ]
+
+
+def _parse_words(words: Iterable[str], n_process: int, batch_size: int) -> Dict:
+    words = list(words)
+    with _word_docs_lock:
+        docs = {word: _word_docs[word] for word in words if word in _word_docs}
+
+    missing = [word for word in words if word not in docs]
+    if missing:
+        docs.update(
+            zip(
+                missing,
+                german_nlp().pipe(
+                    missing,
+                    batch_size=batch_size,
+                    n_process=n_process,
+                    disable=OBSCURE_DISABLED_PIPES,
+                ),
+            )
+        )
 
-    # Check and replace all exact matches of the word
-    modified_sentence = ""
-    for w in sentence_nlp:
-        if any(w.text.lower() == single_word.lower() for single_word in word.split()):
-            modified_sentence += "." * len(w.text) + w.whitespace_
-        else:
-            modified_sentence += w.text_with_ws
+        with _word_docs_lock:
+            if len(_word_docs) + len(missing) > WORD_DOC_CACHE_SIZE:
+                _word_docs.clear()
+            _word_docs.update((word, docs[word]) for word in missing)
 
-    # Check and replace all similar matches of the word
-    closest_word = None
-    highest_similarity = 0
+    return docs
 
-    for w in sentence_nlp:
-        if (target_is_verb and w.pos_ != "VERB") or (
-            target_is_noun and w.pos_ != "NOUN"
-        ):
-            continue
 
-        similarity = w.similarity(word_nlp)
-        if similarity > highest_similarity:
-            highest_similarity = similarity
-            closest_word = w
-
-    if closest_word:
-        sentence = "".join(
-            [
-                "." * len(w.text) + w.whitespace_
-                if w.lemma_ == closest_word.lemma_
-                else w.text_with_ws
-                for w in sentence_nlp
-            ]
+def _obscure(sentence_nlp, word_doc, sentence: str, word: str) -> str | None:
+    if not len(word_doc):
+        print(f"Unable to obscure an empty word in: {sentence}")
+        return None
+
+    word_nlp = word_doc[0]
+    tokens = list(sentence_nlp)
+    if not tokens:
+        return sentence
+
+    texts = [w.text for w in tokens]
+    text = "".join(w.text_with_ws for w in tokens)
+    offsets = [w.idx - tokens[0].idx for w in tokens]
+
+    # Check and replace all exact matches of the word
+    single_words = {single_word.lower() for single_word in word.split()}
+    modified_sentence = _mask_tokens(
+        text, offsets, texts, [t.lower() in single_words for t in texts]
+    )
+
+    # Check and replace all similar matches of the word
+    similarities = _similarities(tokens, word_nlp)
+    if word_nlp.pos_ in ("VERB", "NOUN"):
+        similarities[[w.pos_ != word_nlp.pos_ for w in tokens]] = 0
+
+    # The first strictly highest positive score wins, like the scalar loop did
+    best = int(np.argmax(similarities))
+    if similarities[best] > 0:
+        lemma = tokens[best].lemma_
+        sentence = _mask_tokens(
+            text, offsets, texts, [w.lemma_ == lemma for w in tokens]
         )
 
     return (
@@ -98,15 +268,224 @@ def obscure_closest_word(sentence: str, word: str) -> str | None:
     )
 
 
+def _obscure_with_rules(sentence: str, word: str) -> str | None:
+    targets = [
+        piece.lower()
+        for piece in word.split()
+        if piece.lower() not in _RULES_FILLER_WORDS
+    ]
+    if not targets:
+        print(f"Unable to obscure an empty word in: {sentence}")
+        return None
+
+    tokens = list(re.finditer(r"\w+", sentence))
+    texts = [token.group() for token in tokens]
+    lowered = [text.lower() for text in texts]
+
+    stems = {_stem(target) for target in targets}
+    # The verb without each prefix it may start with, "anfangen" -> "fang"
+    separable = {
+        prefix: _stem(target[len(prefix) :])
+        for prefix, target in (
+            (_separable_prefix(target), target) for target in targets
+        )
+        if prefix
+    }
+    # Separable verbs lose their prefix in main clauses, "fange ... an"
+    detached = {prefix for prefix in separable if prefix in lowered}
+
+    def matches(text: str) -> bool:
+        stem = _stem(text)
+        if text in targets or _matches_stem(stem, stems):
+            return True
+
+        for prefix, rest in separable.items():
+            if prefix in detached and _matches_stem(stem, {rest}):
+                return True
+            # Participles keep the prefix in front of "ge", "angerufen"
+            if text.startswith(prefix) and _matches_stem(
+                _stem(text[len(prefix) :]), {rest}
+            ):
+                return True
+
+        return False
+
+    mask = [matches(text) for text in lowered]
+    if detached:
+        # Only a prefix that follows a matched verb form is part of the verb
+        first_match = mask.index(True) if any(mask) else len(mask)
+        mask = [
+            masked or (i > first_match and text in detached)
+            for i, (masked, text) in enumerate(zip(mask, lowered))
+        ]
+
+    return _mask_tokens(sentence, [token.start() for token in tokens], texts, mask)
+
+
+def _separable_prefix(target: str) -> str | None:
+    # The longest one, "zurückkommen" is "zurück" + "kommen" and not "zu"
+    prefixes = [
+        prefix
+        for prefix in SEPARABLE_VERB_PREFIXES
+        if target.startswith(prefix) and len(target) - len(prefix) > 3
+    ]
+    return max(prefixes, key=len) if prefixes else None
+
+
+def _matches_stem(stem: str, targets: set) -> bool:
+    # Covers inflected endings ("geht" for "gehen") and the "ge" and "zu"
+    # of participles and infinitives. Strong verb forms like "ging" or
+    # "trank" are out of reach of a stemmer
+    candidates = [stem]
+    if stem[:2] in ("ge", "zu"):
+        candidates.append(stem[2:])
+
+    for target in targets:
+        for candidate in candidates:
+            if candidate == target or (
+                len(target) >= 3
+                and candidate.startswith(target)
+                and len(candidate) - len(target) <= 2
+            ):
+                return True
+
+    return False
+
+
+@functools.lru_cache(maxsize=65536)
+def _stem(word: str) -> str:
+    return _german_stemmer().stem(word)
+
+
+@functools.lru_cache(maxsize=None)
+def _german_stemmer():
+    from nltk.stem.snowball import GermanStemmer
+
+    return GermanStemmer()
+
+
+@functools.lru_cache(maxsize=None)
+def _html_parser() -> str:
+    # lxml is optional, html.parser is several times slower on full pages
+    return "lxml" if importlib.util.find_spec("lxml") is not None else "html.parser"
+
+
+def _similarities(tokens, word_nlp) -> np.ndarray:
+    # Token.similarity for all tokens at once: 1.0 for the same orth, 0.0
+    # when either vector is empty, the cosine otherwise
+    vectors = np.array([w.vector for w in tokens], dtype=np.float32)
+    target = np.asarray(word_nlp.vector, dtype=np.float32)
+
+    norms = np.sqrt((vectors**2).sum(axis=1)) * np.sqrt((target**2).sum())
+    with np.errstate(divide="ignore", invalid="ignore"):
+        similarities = np.where(norms != 0, (vectors @ target) / norms, 0.0)
+
+    similarities[[w.orth == word_nlp.orth for w in tokens]] = 1.0
+    return similarities
+
+
+def _mask_tokens(
+    text: str, offsets: List[int], texts: List[str], mask: List[bool]
+) -> str:
+    chars = list(text)
+    for offset, token, masked in zip(offsets, texts, mask):
+        if masked:
+            chars[offset : offset + len(token)] = "." * len(token)
+    return "".join(chars)
+
+
+def reverso_url(verb: str) -> str:
+    return REVERSO_URL.format(verb=verb)
+
+
+def collins_url(word: str) -> str:
+    return COLLINS_URL.format(word=_convert_umlauts(remove_article(word)))
+
+
 def get_conjugation_from_reverso(verb: str) -> str:
-    URL = f"https://conjugator.reverso.net/conjugation-german-verb-{verb}.html"
+    response = requests.get(reverso_url(verb), headers=HEADERS)
+    return _extract_conjugation_info(response.text)
+
+
+def get_declension_info_from_collinsdictionary(word: str) -> str | None:
+    try:
+        response = requests.get(collins_url(word), headers=HEADERS)
+
+        if response and response.text:
+            return _declension_info_to_json(response.text, word)
+        else:
+            return None
+    except Exception as e:
+        print(f"Unable to process the response from collinsdictionary. word: {word}")
+        return None
 
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/89.0.4389.82 Safari/537.36",
+
+def fetch_conjugations_from_reverso(
+    verbs: Iterable[str], fetcher: AsyncFetcher | None = None, reparse: bool = False
+) -> Dict[str, str]:
+    conjugations = _fetch_and_parse(
+        {verb: reverso_url(verb) for verb in verbs},
+        lambda html, _: _extract_conjugation_info(html),
+        REVERSO_PARSER,
+        fetcher,
+        reparse,
+    )
+    return {
+        verb: conjugation
+        for verb, conjugation in conjugations.items()
+        if conjugation is not None
     }
 
-    response = requests.get(URL, headers=headers)
-    soup = BeautifulSoup(response.text, "html.parser")
+
+def fetch_declensions_from_collinsdictionary(
+    words: Iterable[str], fetcher: AsyncFetcher | None = None, reparse: bool = False
+) -> Dict[str, str | None]:
+    return _fetch_and_parse(
+        {word: collins_url(word) for word in words},
+        _declension_info_to_json,
+        COLLINS_PARSER,
+        fetcher,
+        reparse,
+    )
+
+
+def _fetch_and_parse(
+    urls: Dict[str, str],
+    parse: Callable[[str, str], str | None],
+    parser: str,
+    fetcher: AsyncFetcher | None,
+    reparse: bool,
+) -> Dict[str, str | None]:
+    fetcher = fetcher if fetcher is not None else AsyncFetcher(headers=HEADERS)
+    cache = fetcher.cache
+    pages = fetcher.fetch(urls.values())
+
+    results, parsed = {}, {}
+    for key, url in urls.items():
+        html = pages.get(url)
+        if html is None:
+            results[key] = None
+            continue
+
+        # Pages that failed to parse are stored as "" so they are not retried
+        result = None
+        if cache is not None and not reparse:
+            result = cache.get_parsed(url, parser)
+
+        if result is None:
+            result = parse(html, key) or ""
+            parsed[url] = result
+
+        results[key] = result or None
+
+    if cache is not None and parsed:
+        cache.set_parsed(parsed, parser)
+
+    return results
+
+
+def _extract_conjugation_info(html: str) -> str:
+    soup = BeautifulSoup(html, _html_parser(), parse_only=REVERSO_STRAINER)
 
     divs = soup.select("div.wrap-three-col > div.blue-box-wrap[mobile-title]")
 
@@ -114,7 +493,10 @@ def get_conjugation_from_reverso(verb: str) -> str:
 
     for div in divs:
         mobile_title = div.get("mobile-title")
-        div = soup.find("div", attrs={"mobile-title": mobile_title})
+        # The first table with a title is kept when the page repeats it
+        if mobile_title in forms:
+            continue
+
         ul = div.find("ul", class_="wrap-verbs-listing")
         li_tags = ul.find_all("li")
 
@@ -131,26 +513,9 @@ def get_conjugation_from_reverso(verb: str) -> str:
     return json.dumps(forms)
 
 
-def get_declension_info_from_collinsdictionary(word: str) -> str | None:
-    _word = remove_article(word)
-
-    URL = f"https://www.collinsdictionary.com/dictionary/german-english/{_convert_umlauts(_word)}"
-
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/89.0.4389.82 Safari/537.36",
-    }
-
-    try:
-        response = requests.get(URL, headers=headers)
-
-        if response and response.text:
-            declensions = _extract_declension_info(response.text, word)
-            return json.dumps(declensions).strip() if declensions else None
-        else:
-            return None
-    except Exception as e:
-        print(f"Unable to process the response from collinsdictionary. word: {word}")
-        return None
+def _declension_info_to_json(html: str, word: str) -> str | None:
+    declensions = _extract_declension_info(html, word)
+    return json.dumps(declensions).strip() if declensions else None
 
 
 def _count_dots_islands(sentence: str) -> int:
@@ -162,7 +527,7 @@ def _extract_declension_info(html: str, word: str) -> Dict[str, str] | None:
     declension_dict = {}
 
     try:
-        soup = BeautifulSoup(html, "html.parser")
+        soup = BeautifulSoup(html, _html_parser(), parse_only=COLLINS_STRAINER)
 
         # Attempt to get all noun forms from the declension table
         declension_table = soup.find("div", class_="short_noun_table decl")
@@ -0,0 +1,193 @@
+import os
+import sqlite3
+import time
+import zlib
+from typing import Dict, Optional
+
+from anki_ai_helper.helper.io import create_package_directory
+
+
+CACHE_DIRECTORY = "http_cache"
+
+
+class CachedPage:
+    def __init__(
+        self,
+        url: str,
+        status: int,
+        body: Optional[str],
+        etag: Optional[str],
+        last_modified: Optional[str],
+        fetched_at: float,
+    ):
+        self.url = url
+        self.status = status
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = fetched_at
+
+    def is_fresh(self, ttl: float) -> bool:
+        return time.time() - self.fetched_at < ttl
+
+    def validators(self) -> Dict[str, str]:
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class HttpCache:
+    def __init__(
+        self,
+        name: str = "pages",
+        ttl: float = 90 * 24 * 3600,
+        max_bytes: int = 256 * 1024 * 1024,
+    ):
+        self.path = os.path.join(
+            create_package_directory(CACHE_DIRECTORY), f"{name}.sqlite"
+        )
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        # Access times of hits, written with the next write so reads never
+        # hold a write lock while the pages are being fetched
+        self._accessed: Dict[str, float] = {}
+
+        # The fetcher may run its event loop in a helper thread under Jupyter
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY,
+                status INTEGER NOT NULL,
+                body BLOB,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL,
+                parser TEXT,
+                parsed TEXT
+            )
+            """
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS pages_last_access ON pages (last_access)"
+        )
+        self.connection.commit()
+
+    def get(self, url: str) -> Optional[CachedPage]:
+        row = self.connection.execute(
+            "SELECT status, body, etag, last_modified, fetched_at FROM pages WHERE url = ?",
+            (url,),
+        ).fetchone()
+
+        if row is None:
+            return None
+
+        self._accessed[url] = time.time()
+        status, body, etag, last_modified, fetched_at = row
+        return CachedPage(
+            url,
+            status,
+            zlib.decompress(body).decode() if body is not None else None,
+            etag,
+            last_modified,
+            fetched_at,
+        )
+
+    def put(
+        self,
+        url: str,
+        status: int,
+        body: Optional[str],
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ) -> None:
+        compressed = zlib.compress(body.encode(), 6) if body is not None else None
+        now = time.time()
+
+        # A new body invalidates whatever was parsed from the old one
+        with self.connection:
+            self._write_accesses()
+            self.connection.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?, NULL, NULL)",
+                (
+                    url,
+                    status,
+                    compressed,
+                    etag,
+                    last_modified,
+                    now,
+                    len(compressed) if compressed is not None else 0,
+                    now,
+                ),
+            )
+            self._evict()
+
+    def touch(self, url: str) -> None:
+        with self.connection:
+            self.connection.execute(
+                "UPDATE pages SET fetched_at = ? WHERE url = ?", (time.time(), url)
+            )
+
+    def get_parsed(self, url: str, parser: str) -> Optional[str]:
+        row = self.connection.execute(
+            "SELECT parsed FROM pages WHERE url = ? AND parser = ?", (url, parser)
+        ).fetchone()
+        return row[0] if row is not None else None
+
+    def set_parsed(self, parsed: Dict[str, str], parser: str) -> None:
+        with self.connection:
+            self.connection.executemany(
+                "UPDATE pages SET parser = ?, parsed = ? WHERE url = ?",
+                [(parser, value, url) for url, value in parsed.items()],
+            )
+
+    def stats(self) -> Dict[str, int]:
+        entries, size = self.connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM pages"
+        ).fetchone()
+        return {
+            "hits": self.hits,
+            "revalidated": self.revalidated,
+            "misses": self.misses,
+            "entries": entries,
+            "bytes": size,
+        }
+
+    def close(self) -> None:
+        with self.connection:
+            self._write_accesses()
+        self.connection.close()
+
+    def _write_accesses(self) -> None:
+        self.connection.executemany(
+            "UPDATE pages SET last_access = ? WHERE url = ?",
+            [(accessed, url) for url, accessed in self._accessed.items()],
+        )
+        self._accessed = {}
+
+    def _evict(self) -> None:
+        (size,) = self.connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM pages"
+        ).fetchone()
+        if size <= self.max_bytes:
+            return
+
+        evicted = []
+        for url, entry_size in self.connection.execute(
+            "SELECT url, size FROM pages ORDER BY last_access"
+        ):
+            if size <= self.max_bytes:
+                break
+            evicted.append((url,))
+            size -= entry_size
+
+        self.connection.executemany("DELETE FROM pages WHERE url = ?", evicted)
@@ -0,0 +1,160 @@
+import hashlib
+import mmap
+import os
+from typing import Dict, Iterable, Iterator, Tuple
+
+import numpy as np
+
+from anki_ai_helper.helper.io import create_package_directory
+
+
+STORE_DIRECTORY = "inflections"
+
+INDEX_DTYPE = np.dtype([("hash", "<u8"), ("offset", "<u8"), ("length", "<u4")])
+
+# Magic and record count, followed by the index and then the blob
+HEADER_MAGIC = b"INFLSTR1"
+HEADER_DTYPE = np.dtype([("magic", "S8"), ("count", "<u8")])
+
+
+def _hash(kind: str, word: str) -> int:
+    digest = hashlib.blake2b(f"{kind}:{word}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+class InflectionStore:
+    # A sorted array of 64 bit key hashes followed by a blob of
+    # "kind:word\0value" records. Both live in one memory-mapped file, so
+    # lookups never load the whole table and a rebuild is a single rename
+    def __init__(self, name: str = "inflections"):
+        directory = create_package_directory(STORE_DIRECTORY)
+        self.path = os.path.join(directory, f"{name}.store")
+
+        self._map = None
+        self._index = None
+        self._blob = None
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def __len__(self) -> int:
+        return len(self._index) if self._open() else 0
+
+    def get(self, kind: str, word: str) -> str | None:
+        return self.get_many(kind, [word]).get(word)
+
+    def get_many(self, kind: str, words: Iterable[str]) -> Dict[str, str]:
+        words = list(words)
+        if not words or not self._open():
+            return {}
+
+        hashes = np.fromiter(
+            (_hash(kind, word) for word in words), dtype=np.uint64, count=len(words)
+        )
+        positions = np.searchsorted(self._index["hash"], hashes)
+        positions = np.minimum(positions, len(self._index) - 1)
+        found = np.flatnonzero(self._index["hash"][positions] == hashes)
+
+        inflections = {}
+        for i in found:
+            key, value = self._record(positions[i])
+            # Guards against the unlikely hash collision
+            if key == f"{kind}:{words[i]}":
+                inflections[words[i]] = value
+
+        return inflections
+
+    def items(self) -> Iterator[Tuple[str, str, str]]:
+        if not self._open():
+            return
+
+        for position in range(len(self._index)):
+            key, value = self._record(position)
+            if key is None:
+                continue
+            kind, word = key.split(":", 1)
+            yield kind, word, value
+
+    def build(self, entries: Dict[Tuple[str, str], str], merge: bool = True) -> int:
+        if merge:
+            entries = {
+                **{(kind, word): value for kind, word, value in self.items()},
+                **entries,
+            }
+        self.close()
+
+        records = sorted(
+            (_hash(kind, word), f"{kind}:{word}\0{value}".encode())
+            for (kind, word), value in entries.items()
+            if value
+        )
+
+        index = np.zeros(len(records), dtype=INDEX_DTYPE)
+        lengths = np.fromiter((len(record) for _, record in records), np.uint64)
+        index["hash"] = np.fromiter((key_hash for key_hash, _ in records), np.uint64)
+        index["offset"] = np.cumsum(lengths) - lengths
+        index["length"] = lengths
+
+        # Written next to the old file and swapped in with one rename, so a
+        # reader sees either the old or the new store but never a mix
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(np.array([(HEADER_MAGIC, len(records))], HEADER_DTYPE).tobytes())
+            f.write(index.tobytes())
+            for _, record in records:
+                f.write(record)
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(tmp_path, self.path)
+        return len(records)
+
+    def close(self) -> None:
+        # The map is unmapped once no array views it any more
+        self._index = None
+        self._blob = None
+        self._map = None
+
+    def _open(self) -> bool:
+        if self._index is None:
+            if not self.exists() or os.path.getsize(self.path) < HEADER_DTYPE.itemsize:
+                return False
+
+            # Mapped once, the index and the blob always come from one build
+            with open(self.path, "rb") as f:
+                store_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+            header = np.frombuffer(store_map[: HEADER_DTYPE.itemsize], HEADER_DTYPE)[0]
+            index_end = HEADER_DTYPE.itemsize + int(header["count"]) * INDEX_DTYPE.itemsize
+            if header["magic"] != HEADER_MAGIC or index_end > len(store_map):
+                print(f"Ignoring a damaged inflection store: {self.path}")
+                store_map.close()
+                return False
+
+            self._map = store_map
+            self._index = np.frombuffer(
+                store_map,
+                INDEX_DTYPE,
+                count=int(header["count"]),
+                offset=HEADER_DTYPE.itemsize,
+            )
+            self._blob = np.frombuffer(store_map, np.uint8, offset=index_end)
+
+        return len(self._index) > 0
+
+    def _record(self, position: int) -> Tuple[str, str] | Tuple[None, None]:
+        entry = self._index[position]
+        start = int(entry["offset"])
+        end = start + int(entry["length"])
+        if end > len(self._blob):
+            return None, None
+
+        record = self._blob[start:end].tobytes()
+        key, separator, value = record.partition(b"\0")
+        if not separator:
+            return None, None
+
+        try:
+            return key.decode(), value.decode()
+        except UnicodeDecodeError:
+            return None, None
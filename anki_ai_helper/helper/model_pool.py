@@ -0,0 +1,161 @@
+import gc
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+
+class PooledModel:
+    def __init__(self, key: Hashable, resource: Any, device: str, load_time: float):
+        self.key = key
+        self.resource = resource
+        self.device = device
+        self.size = estimate_size(resource)
+        self.load_time = load_time
+
+        self.refs = 0
+        self.acquisitions = 0
+        self.in_use_time = 0.0
+        self.last_used = time.monotonic()
+        self._acquired_at = None
+
+    def acquire(self) -> None:
+        if self.refs == 0:
+            self._acquired_at = time.perf_counter()
+        self.refs += 1
+        self.acquisitions += 1
+        self.last_used = time.monotonic()
+
+    def release(self) -> None:
+        self.refs -= 1
+        if self.refs == 0 and self._acquired_at is not None:
+            self.in_use_time += time.perf_counter() - self._acquired_at
+            self._acquired_at = None
+        self.last_used = time.monotonic()
+
+
+class ModelPool:
+    def __init__(self, budgets: Optional[Dict[str, int]] = None):
+        self._budgets = budgets
+        self._models: Dict[Hashable, PooledModel] = {}
+        self._known_sizes: Dict[Hashable, int] = {}
+        self._lock = threading.RLock()
+
+    @property
+    def budgets(self) -> Dict[str, int]:
+        if self._budgets is None:
+            self._budgets = default_budgets()
+        return self._budgets
+
+    def acquire(self, key: Hashable, loader: Callable[[], Any], device: str) -> Any:
+        with self._lock:
+            entry = self._models.get(key)
+
+            if entry is None:
+                self._evict(device, self._known_sizes.get(key, 0))
+
+                start = time.perf_counter()
+                resource = loader()
+                entry = PooledModel(key, resource, device, time.perf_counter() - start)
+
+                self._models[key] = entry
+                self._known_sizes[key] = entry.size
+
+            entry.acquire()
+            self._evict(device)
+
+            return entry.resource
+
+    def release(self, key: Hashable) -> None:
+        with self._lock:
+            entry = self._models.get(key)
+            if entry is None:
+                return
+
+            entry.release()
+            self._evict(entry.device)
+
+    def clear(self) -> None:
+        with self._lock:
+            for key in [key for key, entry in self._models.items() if entry.refs == 0]:
+                self._unload(key)
+
+    def report(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = [
+                {
+                    "model": str(entry.key),
+                    "device": entry.device,
+                    "size_mb": round(entry.size / 1024**2, 1),
+                    "load_time": round(entry.load_time, 2),
+                    "in_use_time": round(entry.in_use_time, 2),
+                    "acquisitions": entry.acquisitions,
+                    "refs": entry.refs,
+                }
+                for entry in self._models.values()
+            ]
+
+        for row in rows:
+            print(
+                f"{row['model']} [{row['device']}, {row['size_mb']} MB]: loaded in {row['load_time']}s, in use for {row['in_use_time']}s over {row['acquisitions']} acquisitions"
+            )
+
+        return rows
+
+    def _evict(self, device: str, incoming: int = 0) -> None:
+        budget = self.budgets.get(device)
+        if budget is None:
+            return
+
+        resident = [entry for entry in self._models.values() if entry.device == device]
+        used = sum(entry.size for entry in resident) + incoming
+
+        for entry in sorted(resident, key=lambda entry: entry.last_used):
+            if used <= budget:
+                break
+            if entry.refs > 0:
+                continue
+
+            used -= entry.size
+            self._unload(entry.key)
+
+    def _unload(self, key: Hashable) -> None:
+        entry = self._models.pop(key)
+        device = entry.device
+        del entry
+        gc.collect()
+
+        if device.startswith("cuda"):
+            import torch
+
+            torch.cuda.empty_cache()
+
+
+def estimate_size(resource: Any) -> int:
+    if isinstance(resource, (tuple, list)):
+        return sum(estimate_size(item) for item in resource)
+
+    # Diffusers pipelines keep their modules in `components`
+    if hasattr(resource, "components") and isinstance(resource.components, dict):
+        return sum(estimate_size(item) for item in resource.components.values())
+
+    if hasattr(resource, "parameters") and hasattr(resource, "buffers"):
+        tensors = list(resource.parameters()) + list(resource.buffers())
+        return sum(tensor.numel() * tensor.element_size() for tensor in tensors)
+
+    return 0
+
+
+def default_budgets() -> Dict[str, int]:
+    budgets = {"cpu": os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // 2}
+
+    import torch
+
+    if torch.cuda.is_available():
+        total_memory = torch.cuda.get_device_properties(0).total_memory
+        budgets["cuda"] = int(total_memory * 0.8)
+
+    return budgets
+
+
+model_pool = ModelPool()
@@ -0,0 +1,91 @@
+import queue
+import threading
+import traceback
+from typing import Any, Callable, Iterable, List, Optional
+
+
+_DONE = object()
+
+
+class Stage:
+    def __init__(
+        self,
+        name: str,
+        fn: Callable[[Any], Optional[Any]],
+        workers: int = 1,
+        queue_size: int = 16,
+    ):
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.queue_size = queue_size
+
+
+class Pipeline:
+    def __init__(self, stages: List[Stage]):
+        self.stages = stages
+
+    def run(self, source: Iterable) -> int:
+        # Every stage reads from a bounded queue, so a slow stage blocks the
+        # ones before it instead of letting work pile up in memory
+        queues = [queue.Queue(maxsize=stage.queue_size) for stage in self.stages]
+        queues.append(None)
+
+        n_finished = [0]
+        n_finished_lock = threading.Lock()
+        threads = []
+
+        for i, stage in enumerate(self.stages):
+            remaining = [stage.workers]
+            for _ in range(stage.workers):
+                thread = threading.Thread(
+                    target=self._work,
+                    args=(stage, queues[i], queues[i + 1], remaining, n_finished, n_finished_lock),
+                    daemon=True,
+                )
+                thread.start()
+                threads.append(thread)
+
+        try:
+            for item in source:
+                queues[0].put(item)
+        finally:
+            for _ in range(self.stages[0].workers):
+                queues[0].put(_DONE)
+
+            for thread in threads:
+                thread.join()
+
+        return n_finished[0]
+
+    def _work(self, stage, in_queue, out_queue, remaining, n_finished, n_finished_lock):
+        while True:
+            item = in_queue.get()
+            if item is _DONE:
+                break
+
+            try:
+                result = stage.fn(item)
+            except Exception as e:
+                print(f"Error occurred in the {stage.name} stage: {e}")
+                traceback.print_exc()
+                continue
+
+            if result is None:
+                continue
+
+            if out_queue is not None:
+                out_queue.put(result)
+            else:
+                with n_finished_lock:
+                    n_finished[0] += 1
+
+        # The last worker of a stage shuts the next stage down
+        with n_finished_lock:
+            remaining[0] -= 1
+            last_worker = remaining[0] == 0
+
+        if last_worker and out_queue is not None:
+            next_workers = self.stages[self.stages.index(stage) + 1].workers
+            for _ in range(next_workers):
+                out_queue.put(_DONE)
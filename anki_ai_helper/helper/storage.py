@@ -0,0 +1,340 @@
+import json
+import os
+import re
+import shutil
+import sqlite3
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .io import create_package_directory
+
+
+Records = List[Tuple[Any, Dict[str, Any]]]
+
+
+class FrameStorage(ABC):
+    @abstractmethod
+    def schema(self, frame, filename: str) -> Optional[pd.DataFrame]:
+        # An empty frame with the stored columns and dtypes, None when there
+        # is nothing stored yet or the schema can't be read without the data
+        ...
+
+    @abstractmethod
+    def load(
+        self, frame, filename: str, columns: Optional[List[str]] = None
+    ) -> Tuple[Optional[pd.DataFrame], Records]:
+        # Returns the stored frame and the updates to replay on top of it
+        ...
+
+    @abstractmethod
+    def load_columns(self, frame, filename: str, columns: List[str]) -> pd.DataFrame:
+        ...
+
+    @abstractmethod
+    def store(
+        self, frame, filename: str, dirty: Dict[Any, Dict[str, Any]], rewrite: bool
+    ) -> None:
+        ...
+
+
+class ParquetJournalStorage(FrameStorage):
+    def __init__(self, compact_every: int = 2000, backups_to_keep: int = 5):
+        self.compact_every = compact_every
+        self.backups_to_keep = backups_to_keep
+        self._journal_records: Dict[str, int] = {}
+        self._damaged = set()
+
+    def schema(self, frame, filename: str) -> Optional[pd.DataFrame]:
+        full_path = self.path(filename)
+        if not os.path.exists(full_path):
+            return None
+
+        try:
+            import fastparquet
+
+            parquet_file = fastparquet.ParquetFile(full_path)
+            index_columns = (parquet_file.pandas_metadata or {}).get(
+                "index_columns", []
+            )
+            return pd.DataFrame(
+                {
+                    column: pd.Series(dtype=parquet_file.dtypes[column])
+                    for column in parquet_file.columns
+                    if column not in index_columns
+                }
+            )
+        except ImportError:
+            pass
+
+        try:
+            import pyarrow.parquet as pq
+
+            return pq.read_schema(full_path).empty_table().to_pandas()
+        except ImportError:
+            return None
+
+    def load(
+        self, frame, filename: str, columns: Optional[List[str]] = None
+    ) -> Tuple[Optional[pd.DataFrame], Records]:
+        full_path = self.path(filename)
+        df = (
+            _read_parquet(frame, full_path, columns)
+            if os.path.exists(full_path)
+            else None
+        )
+
+        records = []
+        journal_path = self._journal_path(filename)
+        if os.path.exists(journal_path):
+            with open(journal_path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A crash can leave the last record half written, the
+                        # next store() folds everything before it into parquet
+                        print(f"Ignoring a damaged record in {journal_path}")
+                        self._damaged.add(filename)
+                        break
+
+                    records.append((record["key"], record["entries"]))
+
+        self._journal_records[filename] = len(records)
+        return df, records
+
+    def load_columns(self, frame, filename: str, columns: List[str]) -> pd.DataFrame:
+        return _read_parquet(frame, self.path(filename), columns)
+
+    def store(
+        self, frame, filename: str, dirty: Dict[Any, Dict[str, Any]], rewrite: bool
+    ) -> None:
+        # Updates are appended to a journal, the parquet file is only
+        # rewritten once the journal has grown past compact_every records
+        n_records = self._journal_records.get(filename, 0) + len(dirty)
+        if rewrite or filename in self._damaged or n_records > self.compact_every:
+            self._compact(frame.df, filename)
+        elif dirty:
+            self._append_journal(dirty, filename)
+
+    def path(self, filename: str) -> str:
+        filename = f"{os.path.splitext(filename)[0]}.parquet"
+        parquet_directory = create_package_directory("parquets")
+        return os.path.join(parquet_directory, filename)
+
+    def _journal_path(self, filename: str) -> str:
+        return f"{os.path.splitext(self.path(filename))[0]}.journal.jsonl"
+
+    def _append_journal(self, dirty: Dict[Any, Dict[str, Any]], filename: str) -> None:
+        lines = "".join(
+            json.dumps({"key": key, "entries": entries}, default=_to_json) + "\n"
+            for key, entries in dirty.items()
+        )
+
+        with open(self._journal_path(filename), "a") as f:
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+
+        self._journal_records[filename] = (
+            self._journal_records.get(filename, 0) + len(dirty)
+        )
+
+    def _compact(self, df: pd.DataFrame, filename: str) -> None:
+        full_path = self.path(filename)
+        tmp_path = f"{full_path}.tmp"
+
+        df.to_parquet(tmp_path)
+        with open(tmp_path, "rb") as f:
+            os.fsync(f.fileno())
+
+        if os.path.exists(full_path):
+            self._backup(full_path, filename)
+        os.replace(tmp_path, full_path)
+
+        journal_path = self._journal_path(filename)
+        if os.path.exists(journal_path):
+            os.remove(journal_path)
+
+        self._journal_records[filename] = 0
+        self._damaged.discard(filename)
+
+    def _backup(self, full_path: str, filename: str) -> None:
+        backup_directory = create_package_directory("parquet_backups")
+        name = os.path.splitext(filename)[0]
+
+        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+        backup_path = os.path.join(backup_directory, f"{name}_{timestamp}.parquet")
+        shutil.copy2(full_path, backup_path)
+
+        pattern = re.compile(rf"{re.escape(name)}_\d{{14}}\.parquet$")
+        backups = sorted(f for f in os.listdir(backup_directory) if pattern.match(f))
+        for backup in backups[: max(0, len(backups) - self.backups_to_keep)]:
+            os.remove(os.path.join(backup_directory, backup))
+
+
+class SqliteStorage(FrameStorage):
+    SQL_TYPES = {str: "TEXT", int: "INTEGER", float: "REAL", bool: "INTEGER"}
+    PANDAS_TYPES = {"TEXT": "object", "INTEGER": "int64", "REAL": "float64"}
+
+    def __init__(self):
+        self._connections: Dict[str, sqlite3.Connection] = {}
+
+    def schema(self, frame, filename: str) -> Optional[pd.DataFrame]:
+        connection = self._connect(frame, filename)
+        if connection.execute("SELECT 1 FROM rows LIMIT 1").fetchone() is None:
+            return None
+
+        # The table may have been created by another version of the frame.
+        # A column declared the way the frame would declare it gets the
+        # frame's dtype, any other one the dtype of its SQL type
+        return pd.DataFrame(
+            {
+                name: pd.Series(
+                    dtype=frame.dtypes[name]
+                    if name in frame.column_types
+                    and sql_type == self._sql_type(frame.column_types[name])
+                    else self.PANDAS_TYPES.get(sql_type, "object")
+                )
+                for _, name, sql_type, *_ in connection.execute(
+                    "PRAGMA table_info(rows)"
+                )
+            }
+        )
+
+    def load(
+        self, frame, filename: str, columns: Optional[List[str]] = None
+    ) -> Tuple[Optional[pd.DataFrame], Records]:
+        df = self.load_columns(frame, filename, columns or list(frame.column_types))
+        return (df if not df.empty else None), []
+
+    def load_columns(self, frame, filename: str, columns: List[str]) -> pd.DataFrame:
+        names = ", ".join(f'"{column}"' for column in columns)
+        # The frame converts the columns to its dtype policy
+        return pd.read_sql_query(
+            f"SELECT {names} FROM rows ORDER BY rowid",
+            self._connect(frame, filename),
+        )
+
+    def store(
+        self, frame, filename: str, dirty: Dict[Any, Dict[str, Any]], rewrite: bool
+    ) -> None:
+        connection = self._connect(frame, filename)
+        columns = list(frame.column_types)
+
+        # One transaction per store(), readers keep working thanks to WAL
+        with connection:
+            if rewrite:
+                connection.execute("DELETE FROM rows")
+                self._upsert(
+                    connection,
+                    frame,
+                    columns,
+                    frame.df[columns].itertuples(index=False, name=None),
+                )
+                return
+
+            # Only the written cells are updated, so lazy columns stay unread.
+            # The defaults fill the other columns of rows that are new
+            defaults = {
+                column: frame.get_default_value(ptype)
+                for column, ptype in frame.column_types.items()
+            }
+            groups: Dict[Tuple[str, ...], List[List[Any]]] = {}
+            for key, entries in dirty.items():
+                row = {**defaults, **entries, frame.key_column: key}
+                groups.setdefault(
+                    tuple(column for column in columns if column in entries), []
+                ).append([row[column] for column in columns])
+
+            for dirty_columns, rows in groups.items():
+                self._upsert(connection, frame, columns, rows, dirty_columns)
+
+    def _upsert(
+        self,
+        connection: sqlite3.Connection,
+        frame,
+        columns: List[str],
+        rows,
+        updated: Optional[Tuple[str, ...]] = None,
+    ) -> None:
+        names = ", ".join(f'"{column}"' for column in columns)
+        placeholders = ", ".join("?" for _ in columns)
+        updates = ", ".join(
+            f'"{column}" = excluded."{column}"'
+            for column in (updated if updated is not None else columns)
+            if column != frame.key_column
+        )
+        conflict = f"DO UPDATE SET {updates}" if updates else "DO NOTHING"
+
+        connection.executemany(
+            f"INSERT INTO rows ({names}) VALUES ({placeholders}) "
+            f'ON CONFLICT("{frame.key_column}") {conflict}',
+            (
+                [value if type(value) is str else _to_sql(value) for value in row]
+                for row in rows
+            ),
+        )
+
+    def path(self, filename: str) -> str:
+        filename = f"{os.path.splitext(filename)[0]}.sqlite"
+        return os.path.join(create_package_directory("sqlite"), filename)
+
+    def close(self) -> None:
+        for connection in self._connections.values():
+            connection.close()
+        self._connections = {}
+
+    def _connect(self, frame, filename: str) -> sqlite3.Connection:
+        if filename not in self._connections:
+            connection = sqlite3.connect(self.path(filename), check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+
+            columns = ", ".join(
+                f'"{column}" {self._sql_type(ptype)}'
+                + (" PRIMARY KEY" if column == frame.key_column else "")
+                for column, ptype in frame.column_types.items()
+            )
+            connection.execute(f"CREATE TABLE IF NOT EXISTS rows ({columns})")
+            connection.commit()
+
+            self._connections[filename] = connection
+
+        return self._connections[filename]
+
+    def _sql_type(self, python_type) -> str:
+        return self.SQL_TYPES.get(python_type, "TEXT")
+
+
+def _to_json(value: Any) -> Any:
+    if value is pd.NA:
+        return None
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+def _to_sql(value: Any) -> Any:
+    if value is pd.NA:
+        return None
+    if isinstance(value, np.generic):
+        return value.item()
+    if value is None or isinstance(value, (str, int, float, bytes)):
+        return value
+    return str(value)
+
+
+def _read_parquet(
+    frame, path: str, columns: Optional[List[str]] = None
+) -> pd.DataFrame:
+    # Stored strings are read into the string storage of the frame's policy,
+    # otherwise every cell is boxed as a Python str on the way to arrow
+    storage = (
+        "pyarrow" if "string[pyarrow]" in map(str, frame.dtypes.values()) else "python"
+    )
+    with pd.option_context("mode.string_storage", storage):
+        return pd.read_parquet(path, columns=columns)
+
@@ -0,0 +1,164 @@
+import os
+from multiprocessing.connection import Client
+from typing import Any, Dict, List, Optional
+
+from anki_ai_helper.LLM.interface import LlmSingleShot
+from anki_ai_helper.T2I.interfaces import T2I, T2IConfig
+from anki_ai_helper.T2S.interface import T2S
+
+from .protocol import default_address, default_authkey
+
+
+class InferenceServerError(Exception):
+    pass
+
+
+class _Connection:
+    def __init__(self, address: Optional[str], authkey: Optional[bytes]):
+        self.address = address if address is not None else default_address()
+        self.authkey = authkey if authkey is not None else default_authkey()
+        self.connection = None
+
+    def open(self) -> None:
+        self.connection = Client(self.address, family="AF_UNIX", authkey=self.authkey)
+
+    def close(self) -> None:
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def request(self, message: Dict[str, Any]) -> Any:
+        self.connection.send(message)
+        response = self.connection.recv()
+
+        if not response["ok"]:
+            raise InferenceServerError(response["error"])
+        return response["result"]
+
+
+class RemoteLlm(LlmSingleShot):
+    def __init__(
+        self,
+        system_prompt: str,
+        model_name: str = "mistral",
+        address: Optional[str] = None,
+        authkey: Optional[bytes] = None,
+    ):
+        self.system_prompt = system_prompt
+        self.model_name = model_name
+        self._connection = _Connection(address, authkey)
+
+    def __enter__(self) -> "RemoteLlm":
+        self._connection.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        try:
+            self._connection.close()
+            return True
+        except Exception as e:
+            print(f"Unable to gracefully close the connection. Error: {e}")
+            return False
+
+    def shoot(self, prompt: str) -> str:
+        return self.shoot_batch([prompt], batch_size=1)[0]
+
+    def shoot_batch(
+        self,
+        prompts: List[str],
+        batch_size: int = 8,
+        max_new_tokens: Optional[int] = None,
+        json_response: bool = False,
+    ) -> List[Optional[str]]:
+        # The server decides the batch size, it merges concurrent requests
+        return self._connection.request(
+            {
+                "kind": "llm",
+                "system_prompt": self.system_prompt,
+                "prompts": prompts,
+                "max_new_tokens": max_new_tokens,
+                "json_response": json_response,
+            }
+        )
+
+    def request_signature(
+        self, prompt: str, json_response: bool = False
+    ) -> Dict[str, Any]:
+        return {
+            **super().request_signature(prompt, json_response),
+            "model": f"remote:{self.model_name}",
+        }
+
+
+class RemoteT2S(T2S):
+    def __init__(
+        self,
+        lang: str,
+        asset_dir_path: str,
+        address: Optional[str] = None,
+        authkey: Optional[bytes] = None,
+    ):
+        self.lang = lang
+        # Relative paths would resolve against the server's directory
+        self.asset_dir_path = os.path.abspath(asset_dir_path)
+        self._connection = _Connection(address, authkey)
+
+    def __enter__(self) -> "RemoteT2S":
+        self._connection.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        try:
+            self._connection.close()
+            return True
+        except Exception as e:
+            print(f"Unable to gracefully close the connection. Error: {e}")
+            return False
+
+    def shoot(self, text: str, filename: str) -> str:
+        return self._connection.request(
+            {
+                "kind": "t2s",
+                "lang": self.lang,
+                "asset_dir_path": self.asset_dir_path,
+                "text": text,
+                "filename": filename,
+            }
+        )
+
+
+class RemoteT2I(T2I):
+    def __init__(
+        self,
+        config: T2IConfig = None,
+        address: Optional[str] = None,
+        authkey: Optional[bytes] = None,
+    ):
+        self.config = config
+        self._connection = _Connection(address, authkey)
+
+    def __enter__(self) -> "RemoteT2I":
+        self._connection.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        try:
+            self._connection.close()
+            return True
+        except Exception as e:
+            print(f"Unable to gracefully close the connection. Error: {e}")
+            return False
+
+    def run(self, prompt: str, filename: str, prefix: str = ".", **kwargs):
+        return self._connection.request(
+            {
+                "kind": "t2i",
+                "config": self.config,
+                "kwargs": {
+                    "prompt": prompt,
+                    "filename": filename,
+                    "prefix": os.path.abspath(prefix),
+                    **kwargs,
+                },
+            }
+        )
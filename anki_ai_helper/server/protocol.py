@@ -0,0 +1,40 @@
+import os
+import secrets
+
+from anki_ai_helper.helper.io import create_package_directory
+
+
+AUTHKEY_FILENAME = "authkey"
+
+
+def server_directory() -> str:
+    # Only the owner may reach the socket or read the key
+    directory = create_package_directory("server")
+    os.chmod(directory, 0o700)
+    return directory
+
+
+def default_address() -> str:
+    return os.path.join(server_directory(), "inference.sock")
+
+
+def default_authkey() -> bytes:
+    # Requests are pickled, so whoever knows the key can run code in the
+    # server. The key is random per user and created by whoever runs first
+    path = os.path.join(server_directory(), AUTHKEY_FILENAME)
+    if not os.path.exists(path):
+        # Written aside and linked into place, so nobody reads a partial key
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(secrets.token_bytes(32))
+
+        try:
+            os.link(tmp_path, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp_path)
+
+    with open(path, "rb") as f:
+        return f.read()
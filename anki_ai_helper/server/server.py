@@ -0,0 +1,298 @@
+import argparse
+import importlib
+import os
+import queue
+import socket
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from concurrent.futures import Future
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, answer_challenge, deliver_challenge
+from typing import Dict, List, Optional, Tuple
+
+from .protocol import default_address, default_authkey
+
+
+LLM_MODELS: Dict[str, str] = {
+    "mistral": "anki_ai_helper.LLM.mistral_7b_instruct_v02:Mistral7BInstructV02",
+    "vicuna": "anki_ai_helper.LLM.vicuna_7b_v15:Vicuna7Bv15",
+    "tiny": "anki_ai_helper.LLM.tiny_random_llama:TinyRandomLlama",
+}
+
+
+class ServerRunningError(Exception):
+    pass
+
+
+def _import(path: str):
+    module_name, class_name = path.split(":")
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+class LlmRequest:
+    def __init__(
+        self,
+        system_prompt: str,
+        prompts: List[str],
+        max_new_tokens: Optional[int],
+        json_response: bool,
+    ):
+        self.system_prompt = system_prompt
+        self.prompts = prompts
+        self.max_new_tokens = max_new_tokens
+        self.json_response = json_response
+        self.future = Future()
+
+    def group_key(self) -> Tuple:
+        # Every deck build learns its own max_new_tokens, so the budget doesn't
+        # split the batches
+        return (self.system_prompt, self.json_response)
+
+
+def _largest_budget(requests: List[LlmRequest]) -> Optional[int]:
+    # No budget means the model's default, the largest one
+    budgets = [request.max_new_tokens for request in requests]
+    return None if None in budgets else max(budgets)
+
+
+class LlmBatcher:
+    def __init__(
+        self,
+        model_name: str,
+        max_batch_size: int,
+        max_wait: float,
+        max_system_prompts: int = 4,
+    ):
+        self.model_class = _import(LLM_MODELS[model_name])
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_system_prompts = max_system_prompts
+
+        self._queue: "queue.Queue[LlmRequest]" = queue.Queue()
+        self._models: "OrderedDict[str, object]" = OrderedDict()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        while self._models:
+            _, model = self._models.popitem(last=False)
+            model.__exit__(None, None, None)
+
+    def submit(self, request: LlmRequest) -> Future:
+        self._queue.put(request)
+        return request.future
+
+    def _run(self) -> None:
+        while True:
+            requests = self._collect()
+            groups: Dict[Tuple, List[LlmRequest]] = {}
+            for request in requests:
+                groups.setdefault(request.group_key(), []).append(request)
+
+            for group in groups.values():
+                self._process(group)
+
+    def _collect(self) -> List[LlmRequest]:
+        # Block for the first request, then merge whatever arrives shortly after
+        requests = [self._queue.get()]
+        n_prompts = len(requests[0].prompts)
+        deadline = time.monotonic() + self.max_wait
+
+        while n_prompts < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            requests.append(request)
+            n_prompts += len(request.prompts)
+
+        return requests
+
+    def _process(self, requests: List[LlmRequest]) -> None:
+        try:
+            model = self._model(requests[0].system_prompt)
+            responses = model.shoot_batch(
+                [prompt for request in requests for prompt in request.prompts],
+                batch_size=self.max_batch_size,
+                max_new_tokens=_largest_budget(requests),
+                json_response=requests[0].json_response,
+            )
+
+            start = 0
+            for request in requests:
+                end = start + len(request.prompts)
+                request.future.set_result(responses[start:end])
+                start = end
+        except Exception as e:
+            traceback.print_exc()
+            for request in requests:
+                if not request.future.done():
+                    request.future.set_exception(e)
+
+    def _model(self, system_prompt: str):
+        # Entered models share their weights through the model pool and keep
+        # the cache of their system prompt. The least recently used ones are
+        # exited, which hands their weights back to the pool
+        if system_prompt in self._models:
+            self._models.move_to_end(system_prompt)
+            return self._models[system_prompt]
+
+        while len(self._models) >= self.max_system_prompts:
+            _, model = self._models.popitem(last=False)
+            model.__exit__(None, None, None)
+
+        self._models[system_prompt] = self.model_class(system_prompt).__enter__()
+        return self._models[system_prompt]
+
+
+class InferenceServer:
+    def __init__(
+        self,
+        llm: str = "mistral",
+        address: Optional[str] = None,
+        authkey: Optional[bytes] = None,
+        max_batch_size: int = 16,
+        max_wait: float = 0.05,
+    ):
+        self.address = address if address is not None else default_address()
+        self.authkey = authkey if authkey is not None else default_authkey()
+        self.llm = LlmBatcher(llm, max_batch_size, max_wait)
+
+        self._t2s = {}
+        self._t2i = {}
+        self._t2s_lock = threading.Lock()
+        self._t2i_lock = threading.Lock()
+
+    def serve_forever(self) -> None:
+        if os.path.exists(self.address):
+            if _is_listening(self.address):
+                raise ServerRunningError(
+                    f"An inference server is already listening on {self.address}"
+                )
+            # Left behind by a server that didn't shut down cleanly
+            os.remove(self.address)
+
+        self.llm.start()
+        # The key is checked on the connection's own thread, a client that
+        # stalls in the handshake must not hold up the accept loop
+        with Listener(self.address, family="AF_UNIX") as listener:
+            os.chmod(self.address, 0o600)
+            print(f"Inference server listening on {self.address}")
+            try:
+                while True:
+                    try:
+                        connection = listener.accept()
+                    except OSError:
+                        continue
+                    threading.Thread(
+                        target=self._handle, args=(connection,), daemon=True
+                    ).start()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                self._stop()
+
+    def _handle(self, connection) -> None:
+        with connection:
+            try:
+                deliver_challenge(connection, self.authkey)
+                answer_challenge(connection, self.authkey)
+            except (AuthenticationError, EOFError, OSError):
+                # A client with the wrong key, or a probe that hung up
+                return
+
+            while True:
+                try:
+                    message = connection.recv()
+                except (EOFError, OSError):
+                    return
+
+                try:
+                    response = {"ok": True, "result": self._dispatch(message)}
+                except Exception as e:
+                    response = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+
+                connection.send(response)
+
+    def _dispatch(self, message: Dict):
+        kind = message["kind"]
+
+        if kind == "llm":
+            request = LlmRequest(
+                message["system_prompt"],
+                message["prompts"],
+                message.get("max_new_tokens"),
+                message.get("json_response", False),
+            )
+            return self.llm.submit(request).result()
+
+        if kind == "t2s":
+            with self._t2s_lock:
+                tts = self._tts(message["lang"], message["asset_dir_path"])
+                return tts.shoot(message["text"], message["filename"])
+
+        if kind == "t2i":
+            with self._t2i_lock:
+                t2i = self._stable_diffusion(message["config"])
+                return t2i.run(**message["kwargs"])
+
+        raise ValueError(f"Unknown request kind: {kind}")
+
+    def _tts(self, lang: str, asset_dir_path: str):
+        key = (lang, asset_dir_path)
+        if key not in self._t2s:
+            from anki_ai_helper.T2S.tts_v2 import TTSV2
+
+            self._t2s[key] = TTSV2(lang, asset_dir_path).__enter__()
+        return self._t2s[key]
+
+    def _stable_diffusion(self, config):
+        key = config.model_id if config is not None else None
+        if key not in self._t2i:
+            from anki_ai_helper.T2I.stable_diffusion_v15 import StableDiffusionV15
+
+            self._t2i[key] = StableDiffusionV15(config).__enter__()
+        return self._t2i[key]
+
+    def _stop(self) -> None:
+        self.llm.stop()
+        for model in [*self._t2s.values(), *self._t2i.values()]:
+            model.__exit__(None, None, None)
+        if os.path.exists(self.address):
+            os.remove(self.address)
+
+
+def _is_listening(address: str) -> bool:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(address)
+            return True
+        except (ConnectionRefusedError, FileNotFoundError):
+            return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Anki AI Helper inference server")
+    parser.add_argument("--llm", default="mistral", choices=sorted(LLM_MODELS))
+    parser.add_argument("--address", default=None)
+    parser.add_argument("--max-batch-size", type=int, default=16)
+    parser.add_argument("--max-wait-ms", type=float, default=50)
+    args = parser.parse_args()
+
+    InferenceServer(
+        llm=args.llm,
+        address=args.address,
+        max_batch_size=args.max_batch_size,
+        max_wait=args.max_wait_ms / 1000,
+    ).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
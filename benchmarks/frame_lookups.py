@@ -0,0 +1,110 @@
+import argparse
+import random
+import time
+from typing import Callable, Dict, List
+
+# Run from the repository root: python -m benchmarks.frame_lookups
+COLUMNS = ["1_fil", "1_trans", "2_fil"]
+
+
+def _frame(n_keys: int):
+    from anki_ai_helper.anki.style.two_sentence_puzzler import (
+        TwoSentencePuzzlerDataFrame,
+    )
+
+    frame = TwoSentencePuzzlerDataFrame()
+    frame.upsert_many(
+        {
+            f"word {i}": {column: f"{column} of word {i}" for column in COLUMNS}
+            for i in range(n_keys)
+        }
+    )
+    frame.df
+    return frame
+
+
+# The column scans GenericDataFrame did before it kept a key index, on the
+# object columns it used then
+
+
+def _scan_is_duplicate(df, key) -> bool:
+    return key in df["word"].values
+
+
+def _scan_get_values(df, key) -> Dict:
+    if key not in df["word"].values:
+        return None
+
+    row = df.loc[df["word"] == key, COLUMNS]
+    return row.to_dict(orient="records")[0]
+
+
+def _scan_upsert(df, key, entries) -> None:
+    for col, value in entries.items():
+        df.loc[df["word"] == key, col] = value
+
+
+def _per_key_us(run: Callable, keys: List[str]) -> float:
+    start = time.perf_counter()
+    for key in keys:
+        run(key)
+    return (time.perf_counter() - start) * 1e6 / len(keys)
+
+
+def measure(n_keys: int, n_scanned: int) -> Dict[str, Dict[str, float]]:
+    frame = _frame(n_keys)
+    keys = list(frame.key_array())
+    random.Random(13).shuffle(keys)
+    scanned = keys[:n_scanned]
+    df = frame.df.astype(object)
+
+    indexed = {
+        "is_duplicate": _per_key_us(frame.is_duplicate, keys),
+        "get_values": _per_key_us(lambda key: frame.get_values(key, COLUMNS), keys),
+        "upsert": _per_key_us(
+            lambda key: frame.upsert(key, {"1_trans": "updated"}), keys
+        ),
+    }
+    # The buffered updates are applied on the next read
+    start = time.perf_counter()
+    frame.df
+    indexed["upsert"] += (time.perf_counter() - start) * 1e6 / len(keys)
+
+    scan = {
+        "is_duplicate": _per_key_us(lambda key: _scan_is_duplicate(df, key), scanned),
+        "get_values": _per_key_us(lambda key: _scan_get_values(df, key), scanned),
+        "upsert": _per_key_us(
+            lambda key: _scan_upsert(df, key, {"1_trans": "updated"}), scanned
+        ),
+    }
+    return {"indexed": indexed, "scan": scan}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Per key cost of GenericDataFrame lookups and upserts with "
+        "the key index and with column scans"
+    )
+    parser.add_argument("--keys", type=int, default=50000)
+    parser.add_argument(
+        "--scanned",
+        type=int,
+        default=200,
+        help="keys timed with the column scans, which take O(n) each",
+    )
+    args = parser.parse_args()
+
+    result = measure(args.keys, args.scanned)
+
+    print(f"{args.keys} keys, per key (and for all keys):")
+    for operation, indexed in result["indexed"].items():
+        scan = result["scan"][operation]
+        print(
+            f"  {operation}: index {indexed:.1f} us ({indexed * args.keys / 1e6:.2f} s), "
+            f"scan {scan:.0f} us ({scan * args.keys / 1e6:.0f} s), "
+            f"{scan / indexed:.0f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import uuid
+from typing import Dict
+
+# Run from the repository root: python -m benchmarks.frame_memory
+BENCHMARK_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+STORE_NAME = "memory"
+
+# "keys" loads the store with arrow strings and reads only the key column,
+# like a stage that doesn't touch the other columns
+POLICIES = ["object", "arrow", "keys"]
+
+WORDS = (
+    "der die das Hund Katze Haus Kind Mutter geht läuft spielt trinkt isst "
+    "schnell heute gern Wasser Buch Garten Schule nach in mit zur um acht Uhr"
+).split()
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def _sentence(rng: random.Random) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 14))) + "."
+
+
+def build_store(n_rows: int) -> None:
+    # Sentences, translations and UUID voice file names like a finished deck
+    from anki_ai_helper.anki.style.two_sentence_puzzler import (
+        TwoSentencePuzzlerDataFrame,
+    )
+
+    rng = random.Random(18)
+    records = {}
+    for i in range(n_rows):
+        entries = {
+            column: _sentence(rng)
+            for column in TwoSentencePuzzlerDataFrame.COLUMNS
+            if column != "word"
+        }
+        for column in entries:
+            if column.endswith("_vce"):
+                entries[column] = f"{uuid.UUID(int=rng.getrandbits(128))}.wav"
+        entries["expl_2"] = ""
+        records[f"word {i}"] = entries
+
+    frame = TwoSentencePuzzlerDataFrame()
+    frame.upsert_many(records)
+    frame.store(STORE_NAME)
+
+
+def measure(policy: str) -> Dict:
+    from anki_ai_helper.anki.style.two_sentence_puzzler import (
+        TwoSentencePuzzlerDataFrame,
+    )
+    from anki_ai_helper.helper.dataframe import GenericDataFrame
+
+    columns = TwoSentencePuzzlerDataFrame.COLUMNS
+    dtype = "object" if policy == "object" else "string[pyarrow]"
+    rss_before = _rss_mb()
+    peak_before = _peak_rss_mb()
+
+    frame = GenericDataFrame(
+        columns, "word", dtypes={column: dtype for column in columns}
+    )
+    frame.load_and_append(STORE_NAME)
+    if policy != "keys":
+        frame.df
+
+    return {
+        "policy": policy,
+        "rows": len(frame.key_array()),
+        "frame_mb": sum(frame._df.memory_usage(deep=True, index=False)) / 2**20,
+        "rss_mb": _rss_mb() - rss_before,
+        "peak_mb": _peak_rss_mb() - peak_before,
+    }
+
+
+def run_isolated(policy: str, home: str) -> Dict:
+    # Every policy loads the store in its own interpreter so the RSS numbers
+    # don't mix
+    result = subprocess.run(
+        [sys.executable, "-m", "benchmarks.frame_memory", "--worker", policy],
+        cwd=os.path.dirname(BENCHMARK_DIRECTORY),
+        env={**os.environ, "HOME": home},
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        error = (result.stderr.strip().splitlines() or ["unknown error"])[-1]
+        return {"policy": policy, "error": error}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Memory of a stored puzzler deck after loading it with "
+        "object and arrow string columns"
+    )
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--policies", nargs="+", default=POLICIES, choices=POLICIES)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(measure(args.worker)))
+        return
+
+    # The store lives in a throw away home, the package keeps its data there
+    with tempfile.TemporaryDirectory() as home:
+        build = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                f"from benchmarks.frame_memory import build_store; build_store({args.rows})",
+            ],
+            cwd=os.path.dirname(BENCHMARK_DIRECTORY),
+            env={**os.environ, "HOME": home},
+        )
+        if build.returncode != 0:
+            sys.exit(build.returncode)
+
+        for policy in args.policies:
+            result = run_isolated(policy, home)
+            if "error" in result:
+                print(f"{policy}: unavailable ({result['error']})")
+                continue
+
+            print(
+                f"{policy}: {result['rows']} rows, frame {result['frame_mb']:.0f} MB, "
+                f"RSS +{result['rss_mb']:.0f} MB after load "
+                f"(peak +{result['peak_mb']:.0f} MB)"
+            )
+
+
+if __name__ == "__main__":
+    main()
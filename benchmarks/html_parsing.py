@@ -0,0 +1,119 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+from typing import Dict
+
+# Run from the repository root: python -m benchmarks.html_parsing
+BENCHMARK_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+FIXTURE_DIRECTORY = os.path.join(BENCHMARK_DIRECTORY, "data", "html")
+
+# Saved pages with the markup the parsers read, inside the navigation,
+# script and style chrome of a full page. The word is the page's lookup
+FIXTURES = {
+    "reverso_gehen.html": ("reverso", "gehen"),
+    "reverso_rufen.html": ("reverso", "rufen"),
+    "collins_hund.html": ("collins", "der Hund"),
+    "collins_haus.html": ("collins", "das Haus"),
+}
+
+
+def load_fixtures() -> Dict[str, str]:
+    pages = {}
+    for name in FIXTURES:
+        with open(os.path.join(FIXTURE_DIRECTORY, name), encoding="utf-8") as f:
+            pages[name] = f.read()
+    return pages
+
+
+def measure(n_pages: int) -> Dict[str, float]:
+    from bs4 import BeautifulSoup
+
+    from anki_ai_helper.helper import german as ger_helper
+    from anki_ai_helper.helper.async_fetch import AsyncFetcher
+    from anki_ai_helper.helper.http_cache import HttpCache
+
+    fixtures = load_fixtures()
+
+    # Every fixture is cached under n_pages lookups, like a deck's worth of
+    # pages that are parsed again after a parser change
+    cache = HttpCache("html_parsing")
+    lookups = {"reverso": {}, "collins": {}}
+    for name, (site, word) in FIXTURES.items():
+        for i in range(n_pages // len(FIXTURES)):
+            lookup = f"{word}{i}"
+            url = (
+                ger_helper.reverso_url(lookup)
+                if site == "reverso"
+                else ger_helper.collins_url(lookup)
+            )
+            cache.put(url, 200, fixtures[name])
+            lookups[site][lookup] = name
+    fetcher = AsyncFetcher(cache=cache, offline=True, progress=False)
+    n_lookups = sum(map(len, lookups.values()))
+
+    def parse_all(reparse: bool):
+        return (
+            ger_helper.fetch_conjugations_from_reverso(
+                lookups["reverso"], fetcher, reparse
+            ),
+            ger_helper.fetch_declensions_from_collinsdictionary(
+                lookups["collins"], fetcher, reparse
+            ),
+        )
+
+    start = time.perf_counter()
+    conjugations, declensions = parse_all(reparse=True)
+    parsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    parse_all(reparse=False)
+    cached = time.perf_counter() - start
+
+    # What building the whole tree with html.parser costs, before any search
+    start = time.perf_counter()
+    for site_lookups in lookups.values():
+        for name in site_lookups.values():
+            BeautifulSoup(fixtures[name], "html.parser")
+    full_tree = time.perf_counter() - start
+
+    cache.close()
+    return {
+        "pages": n_lookups,
+        "kb_per_page": sum(map(len, fixtures.values())) / len(fixtures) / 1024,
+        "parsed": n_lookups / parsed,
+        "cached": n_lookups / cached,
+        "full_tree": n_lookups / full_tree,
+        "tables": min(len(json.loads(c)) for c in conjugations.values()),
+        "declensions": sum(d is not None for d in declensions.values()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Pages per second when re-parsing cached Reverso and Collins "
+        "pages"
+    )
+    parser.add_argument("--pages", type=int, default=400)
+    args = parser.parse_args()
+
+    # The page cache lives in a throw away home, the package keeps it there
+    with tempfile.TemporaryDirectory() as home:
+        os.environ["HOME"] = home
+        result = measure(args.pages)
+
+    print(
+        f"{result['pages']} cached pages of {result['kb_per_page']:.0f} KB: "
+        f"parsed {result['parsed']:.0f} pages/s, "
+        f"stored results {result['cached']:.0f} pages/s, "
+        f"full html.parser tree alone {result['full_tree']:.0f} pages/s"
+    )
+    print(
+        f"every conjugation page gave {result['tables']} tables, "
+        f"{result['declensions']} declension pages parsed"
+    )
+
+
+if __name__ == "__main__":
+    main()
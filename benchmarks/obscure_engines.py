@@ -0,0 +1,128 @@
+import argparse
+import json
+import os
+import re
+import resource
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+# Run from the repository root: python -m benchmarks.obscure_engines
+BENCHMARK_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+LABELLED_SENTENCES = os.path.join(BENCHMARK_DIRECTORY, "data", "obscure_labelled.jsonl")
+
+
+def load_cases(path: str = LABELLED_SENTENCES) -> List[Dict]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def expected_puzzle(sentence: str, hidden: List[str]) -> str:
+    # Every occurrence of a hidden token is replaced by as many dots
+    return re.sub(
+        r"\w+",
+        lambda m: "." * len(m.group()) if m.group() in hidden else m.group(),
+        sentence,
+    )
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure(engine: str, repeat: int) -> Dict:
+    from anki_ai_helper.helper import german as ger_helper
+
+    cases = load_cases()
+    pairs = [
+        (case["sentence"], ger_helper.remove_article(case["word"])) for case in cases
+    ]
+    rss_before = _peak_rss_mb()
+
+    # The first call pays for loading the model or the stemmer
+    start = time.perf_counter()
+    puzzles = ger_helper.obscure_closest_words(pairs, engine=engine)
+    first_call = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        ger_helper.obscure_closest_words(pairs, engine=engine)
+    elapsed = time.perf_counter() - start
+
+    misses = [
+        {"word": case["word"], "puzzle": puzzle, "expected": expected}
+        for case, puzzle in zip(cases, puzzles)
+        if puzzle != (expected := expected_puzzle(case["sentence"], case["hidden"]))
+    ]
+
+    return {
+        "engine": engine,
+        "correct": len(cases) - len(misses),
+        "total": len(cases),
+        "first_call_ms": first_call * 1000,
+        "ms_per_sentence": elapsed * 1000 / (repeat * len(pairs)),
+        "sentences_per_s": repeat * len(pairs) / elapsed,
+        "rss_mb": _peak_rss_mb() - rss_before,
+        "misses": misses,
+    }
+
+
+def run_isolated(engine: str, repeat: int) -> Dict:
+    # Every engine runs in its own interpreter so the RSS numbers don't mix
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "benchmarks.obscure_engines",
+            "--worker",
+            engine,
+            "--repeat",
+            str(repeat),
+        ],
+        cwd=os.path.dirname(BENCHMARK_DIRECTORY),
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        error = (result.stderr.strip().splitlines() or ["unknown error"])[-1]
+        return {"engine": engine, "error": error}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Accuracy, latency and memory of the obscuring engines on "
+        "hand labelled sentences"
+    )
+    parser.add_argument("--engines", nargs="+", default=["spacy", "rules"])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--verbose", action="store_true")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(measure(args.worker, args.repeat)))
+        return
+
+    for engine in args.engines:
+        result = run_isolated(engine, args.repeat)
+        if "error" in result:
+            print(f"{engine}: unavailable ({result['error']})")
+            continue
+
+        print(
+            f"{engine}: accuracy {result['correct']}/{result['total']}, "
+            f"first call {result['first_call_ms']:.0f} ms, "
+            f"{result['ms_per_sentence']:.3f} ms/sentence "
+            f"({result['sentences_per_s']:.0f} sentences/s), "
+            f"RSS +{result['rss_mb']:.0f} MB"
+        )
+        if args.verbose:
+            for miss in result["misses"]:
+                print(f"  {miss['word']}: {miss['puzzle']} (expected {miss['expected']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import argparse
+import json
+import os
+import time
+import warnings
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+# Run from the repository root: python -m benchmarks.obscure_throughput
+BENCHMARK_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+GOLDEN_PAIRS = os.path.join(
+    os.path.dirname(BENCHMARK_DIRECTORY), "tests", "data", "obscure_golden_pairs.jsonl"
+)
+
+
+def load_pairs(path: str = GOLDEN_PAIRS) -> List[Tuple[str, str]]:
+    with open(path) as f:
+        return [(record["sentence"], record["word"]) for record in map(json.loads, f)]
+
+
+def _pipeline(model: str, pairs: List[Tuple[str, str]]):
+    import spacy
+
+    if model != "blank":
+        return spacy.load(model)
+
+    # Random 300 dimensional vectors, the size of de_core_news_lg's, and no
+    # tagger, so only the similarity search and the masking are timed
+    nlp = spacy.blank("de")
+    rng = np.random.default_rng(23)
+    texts = {
+        token.text
+        for sentence, word in pairs
+        for token in [*nlp.make_doc(sentence), *nlp.make_doc(word)]
+    }
+    for text in sorted(texts):
+        nlp.vocab.set_vector(text, rng.standard_normal(300).astype(np.float32))
+    return nlp
+
+
+def _token_similarity(nlp, pairs: List[Tuple[str, str]]) -> None:
+    # The scoring the engine replaced, one Token.similarity per token. The
+    # sentences were rebuilt in Python on top of this
+    words = {word: nlp(word)[0] for word in {word for _, word in pairs}}
+    for doc, (_, word) in zip(nlp.pipe(sentence for sentence, _ in pairs), pairs):
+        for token in doc:
+            token.similarity(words[word])
+
+
+def _rate(run, pairs: List[Tuple[str, str]], repeat: int) -> float:
+    run()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        run()
+    return repeat * len(pairs) / (time.perf_counter() - start)
+
+
+def measure(model: str, repeat: int) -> Dict[str, float]:
+    from anki_ai_helper.helper import german as ger_helper
+
+    pairs = load_pairs()
+    nlp = _pipeline(model, pairs)
+
+    with warnings.catch_warnings():
+        # Token.similarity warns about every empty vector
+        warnings.simplefilter("ignore")
+        return {
+            "engine": _rate(
+                lambda: ger_helper.obscure_closest_words(pairs, nlp=nlp), pairs, repeat
+            ),
+            "token_similarity": _rate(
+                lambda: _token_similarity(nlp, pairs), pairs, repeat
+            ),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Sentences per second of the spaCy obscuring engine on the "
+        "golden test pairs"
+    )
+    parser.add_argument(
+        "--model",
+        default="de_core_news_lg",
+        help='a spaCy model, or "blank" for random vectors without a tagger',
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    result = measure(args.model, args.repeat)
+    print(
+        f"{args.model}: engine {result['engine']:.0f} sentences/s, "
+        f"Token.similarity scoring alone {result['token_similarity']:.0f} sentences/s"
+    )
+
+
+if __name__ == "__main__":
+    main()
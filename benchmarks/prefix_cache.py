@@ -0,0 +1,145 @@
+import argparse
+import importlib
+import time
+from typing import Dict, List
+
+# Run from the repository root: python -m benchmarks.prefix_cache --llm tiny
+WORDS = [
+    ("der Hund", "Noun"),
+    ("gehen", "Verb"),
+    ("schnell", "Other"),
+    ("die Katze", "Noun"),
+    ("anrufen", "Verb"),
+    ("heute", "Other"),
+    ("das Haus", "Noun"),
+    ("trinken", "Verb"),
+]
+
+BACKENDS = ["default", "cuda", "cpu-bf16", "cpu-int8"]
+
+
+def _model_class(llm: str, model_path: str = None):
+    from anki_ai_helper.server.server import LLM_MODELS
+
+    module_name, class_name = LLM_MODELS[llm].split(":")
+    model_class = getattr(importlib.import_module(module_name), class_name)
+    if model_path is None:
+        return model_class
+
+    # A local copy of the weights, e.g. for machines without network access
+    return type(model_class.__name__, (model_class,), {"MODEL_NAME": model_path})
+
+
+def _backend(name: str):
+    from anki_ai_helper.LLM import causal_lm
+
+    return {
+        "default": None,
+        "cuda": causal_lm.CUDA_BACKEND,
+        "cpu-bf16": causal_lm.CPU_BF16_BACKEND,
+        "cpu-int8": causal_lm.CPU_INT8_BACKEND,
+    }[name]
+
+
+def _prompts(n: int) -> List[str]:
+    from anki_ai_helper.anki.ai_sprach_meister import AiSprachMeisterPrompt
+
+    prompts = AiSprachMeisterPrompt.PROMPTS["translation"]["word"]
+    return [
+        prompts[word_type].replace(AiSprachMeisterPrompt.WORD_PLACEHOLDER, word)
+        for word, word_type in (WORDS * (n // len(WORDS) + 1))[:n]
+    ]
+
+
+def _full_prefill(llm, prompts: List[str]) -> None:
+    # What every call did before the system prompt was cached: the template
+    # with the system prompt is tokenized and prefilled for each query
+    import torch
+
+    inputs = llm.tokenizer(
+        [
+            llm._template.format(system=llm.system_prompt, query=prompt)
+            for prompt in prompts
+        ],
+        return_tensors="pt",
+        padding=True,
+        return_token_type_ids=False,
+    ).to(llm.backend.device)
+    with torch.no_grad():
+        llm.model.generate(
+            **inputs,
+            **{**llm._generation_config, "max_new_tokens": 1, "min_new_tokens": 0},
+            pad_token_id=llm.tokenizer.pad_token_id,
+        )
+
+
+def _time_batches(run, prompts: List[str], batch_size: int, repeat: int) -> float:
+    run(prompts[:batch_size])
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for i in range(0, len(prompts), batch_size):
+            run(prompts[i : i + batch_size])
+    n_batches = repeat * ((len(prompts) + batch_size - 1) // batch_size)
+    return (time.perf_counter() - start) / n_batches
+
+
+def measure(args) -> Dict:
+    from anki_ai_helper.anki.ai_sprach_meister import AiSprachMeisterPrompt
+
+    model_class = _model_class(args.llm, args.model_path)
+    prompts = _prompts(args.n_prompts)
+
+    with model_class(
+        AiSprachMeisterPrompt.SYSTEM_PROMPT, backend=_backend(args.backend)
+    ) as llm:
+        # max_new_tokens=1 makes the time of a call its time to first token
+        cached = _time_batches(
+            lambda batch: llm.shoot_batch(batch, len(batch), max_new_tokens=1),
+            prompts,
+            args.batch_size,
+            args.repeat,
+        )
+        full = _time_batches(
+            lambda batch: _full_prefill(llm, batch),
+            prompts,
+            args.batch_size,
+            args.repeat,
+        )
+
+        return {
+            "system_tokens": int(llm._prefix_ids.shape[1]),
+            "query_tokens": sum(map(llm.count_tokens, prompts)) / len(prompts),
+            "cached_ms": cached * 1000,
+            "full_ms": full * 1000,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time to first token of a batch with and without the cached "
+        "system prompt"
+    )
+    parser.add_argument("--llm", default="tiny", choices=["mistral", "vicuna", "tiny"])
+    parser.add_argument("--model-path", help="load the weights from this directory")
+    parser.add_argument("--backend", default="default", choices=BACKENDS)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--n-prompts", type=int, default=32)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    result = measure(args)
+    print(
+        f"{args.llm} ({args.backend}), system prompt {result['system_tokens']} "
+        f"tokens, query {result['query_tokens']:.0f} tokens on average"
+    )
+    print(
+        f"time to first token per batch of {args.batch_size}: "
+        f"cached {result['cached_ms']:.1f} ms, "
+        f"full prefill {result['full_ms']:.1f} ms "
+        f"({result['full_ms'] / result['cached_ms']:.1f}x)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -8,6 +8,7 @@ setup(
         "mypy",
         "pandas",
         "fastparquet",
+        "pyarrow",
         "torch",
         "transformers",
         "sentencepiece",
@@ -20,5 +21,6 @@ setup(
         "diffusers",
         "spacy",
         "BeautifulSoup",
+        "aiohttp",
     ],
 )
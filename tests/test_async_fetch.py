@@ -0,0 +1,97 @@
+import asyncio
+import time
+
+import pytest
+
+web = pytest.importorskip("aiohttp.web")
+
+from anki_ai_helper.helper.async_fetch import AsyncFetcher  # noqa: E402
+
+# Every response of the stub server takes this long, like a slow page
+LATENCY = 0.2
+
+
+def _serve(fetcher: AsyncFetcher, paths, delays=None):
+    # Fetches the paths from a local stub server and returns the pages, the
+    # arrival time of each request and the elapsed time
+    arrivals = []
+    attempts = {}
+
+    async def handle(request):
+        name = request.match_info["name"]
+        arrivals.append(time.monotonic())
+        attempts[name] = attempts.get(name, 0) + 1
+        await asyncio.sleep((delays or {}).get(name, LATENCY))
+
+        if name == "missing":
+            return web.Response(status=404)
+        if name.startswith("flaky") and attempts[name] == 1:
+            return web.Response(status=503)
+        return web.Response(text=f"page {name}")
+
+    async def run():
+        app = web.Application()
+        app.add_routes([web.get("/{name}", handle)])
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        host, port = runner.addresses[0][:2]
+
+        try:
+            start = time.monotonic()
+            pages = await fetcher.fetch_all(
+                [f"http://{host}:{port}/{path}" for path in paths]
+            )
+            elapsed = time.monotonic() - start
+        finally:
+            await runner.cleanup()
+
+        return {url.rsplit("/", 1)[1]: page for url, page in pages.items()}, elapsed
+
+    pages, elapsed = asyncio.run(run())
+    return pages, arrivals, attempts, elapsed
+
+
+def test_concurrent_requests_overlap():
+    fetcher = AsyncFetcher(concurrency=10, rate_per_host=100, burst=10, progress=False)
+    paths = [f"w{i}" for i in range(10)]
+
+    pages, _, _, elapsed = _serve(fetcher, paths)
+
+    assert pages == {path: f"page {path}" for path in paths}
+    # One after another they would take 10 * LATENCY
+    assert elapsed < 5 * LATENCY
+
+
+def test_rate_limit_spaces_requests():
+    fetcher = AsyncFetcher(concurrency=10, rate_per_host=10, burst=1, progress=False)
+
+    _, arrivals, _, _ = _serve(fetcher, [f"w{i}" for i in range(6)])
+
+    gaps = [b - a for a, b in zip(arrivals, arrivals[1:])]
+    assert min(gaps) > 0.08
+    # The budget, not the latency of the server, bounds the throughput
+    assert arrivals[-1] - arrivals[0] < 5 * LATENCY
+
+
+def test_retries_and_final_errors():
+    fetcher = AsyncFetcher(
+        rate_per_host=100, burst=10, retries=2, backoff=0.01, progress=False
+    )
+
+    pages, _, attempts, _ = _serve(fetcher, ["flaky", "missing"])
+
+    assert pages == {"flaky": "page flaky", "missing": None}
+    assert attempts == {"flaky": 2, "missing": 1}
+
+
+def test_timeout_gives_up_after_retries():
+    fetcher = AsyncFetcher(
+        rate_per_host=100, burst=10, retries=1, backoff=0.01, timeout=0.1, progress=False
+    )
+
+    pages, _, attempts, _ = _serve(fetcher, ["slow"], delays={"slow": 1.0})
+
+    assert pages == {"slow": None}
+    assert attempts == {"slow": 2}
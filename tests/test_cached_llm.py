@@ -0,0 +1,76 @@
+from typing import List, Optional
+
+import pytest
+
+from anki_ai_helper.LLM.cached import CachedLlm
+from anki_ai_helper.LLM.interface import LlmSingleShot
+
+
+class FakeLlm(LlmSingleShot):
+    # Answers with one token per word of the prompt, cut at the budget
+    entered = 0
+    generated: List[str] = []
+
+    def __init__(self, system_prompt: str):
+        self.system_prompt = system_prompt
+
+    def __enter__(self) -> "FakeLlm":
+        FakeLlm.entered += 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        return True
+
+    def shoot(self, prompt: str) -> str:
+        return self.shoot_batch([prompt])[0]
+
+    def shoot_batch(
+        self,
+        prompts: List[str],
+        batch_size: int = 8,
+        max_new_tokens: Optional[int] = None,
+        json_response: bool = False,
+    ) -> List[Optional[str]]:
+        FakeLlm.generated.extend(prompts)
+        return [" ".join(prompt.split()[:max_new_tokens]) for prompt in prompts]
+
+    def count_tokens(self, text: str) -> int:
+        return len(text.split())
+
+
+@pytest.fixture
+def cached(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    FakeLlm.entered = 0
+    FakeLlm.generated = []
+    return CachedLlm.wrap(FakeLlm, cache_name="test")
+
+
+def test_rerun_with_another_budget_hits_without_loading_the_model(cached):
+    prompts = [" ".join(["word"] * (i % 20 + 1)) + f" {i}" for i in range(200)]
+
+    with cached("system") as model:
+        first = model.shoot_batch(prompts, max_new_tokens=48)
+    assert FakeLlm.entered == 1
+
+    # Budgets are learned per run and rarely come out the same twice
+    for max_new_tokens in (40, 64, None):
+        with cached("system") as model:
+            assert model.shoot_batch(prompts, max_new_tokens=max_new_tokens) == first
+    assert FakeLlm.entered == 1
+
+
+def test_truncated_responses_are_generated_again_for_a_larger_budget(cached):
+    prompts = ["one two three four five six seven eight nine ten", "short one"]
+
+    with cached("system") as model:
+        assert model.shoot_batch(prompts, max_new_tokens=4) == [
+            "one two three four",
+            "short one",
+        ]
+        # A smaller budget would have cut it at least as early
+        model.shoot_batch(prompts, max_new_tokens=3)
+        assert FakeLlm.generated == prompts
+
+        assert model.shoot_batch(prompts, max_new_tokens=16)[0] == prompts[0]
+        assert FakeLlm.generated == prompts + prompts[:1]
@@ -0,0 +1,85 @@
+import pytest
+
+pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+tokenizers = pytest.importorskip("tokenizers")
+
+from anki_ai_helper.LLM.causal_lm import (  # noqa: E402
+    CPU_BF16_BACKEND,
+    CPU_INT8_BACKEND,
+    CausalLmSingleShot,
+)
+from anki_ai_helper.anki.ai_sprach_meister import (  # noqa: E402
+    AiSprachMeister,
+    AiSprachMeisterPrompt,
+)
+from anki_ai_helper.dataset.dict_word_list import DictWordList  # noqa: E402
+
+CORPUS = [
+    AiSprachMeisterPrompt.SYSTEM_PROMPT,
+    '{"German": "Der Hund läuft schnell nach Hause.", "English": "The dog runs."}',
+    "Die Katze trinkt Wasser. Ich gehe heute in den Park.",
+]
+
+
+@pytest.fixture(scope="module")
+def model_directory(tmp_path_factory):
+    # A Llama of a few kB and a byte level BPE tokenizer, built offline
+    directory = tmp_path_factory.mktemp("tiny_llama")
+
+    tokenizer = tokenizers.Tokenizer(tokenizers.models.BPE(unk_token=None))
+    tokenizer.pre_tokenizer = tokenizers.pre_tokenizers.ByteLevel()
+    tokenizer.decoder = tokenizers.decoders.ByteLevel()
+    tokenizer.train_from_iterator(
+        CORPUS,
+        tokenizers.trainers.BpeTrainer(
+            vocab_size=300,
+            special_tokens=["<s>", "</s>"],
+            initial_alphabet=tokenizers.pre_tokenizers.ByteLevel.alphabet(),
+        ),
+    )
+    transformers.PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer, bos_token="<s>", eos_token="</s>"
+    ).save_pretrained(directory)
+
+    config = transformers.LlamaConfig(
+        vocab_size=tokenizer.get_vocab_size(),
+        hidden_size=16,
+        intermediate_size=32,
+        num_hidden_layers=2,
+        num_attention_heads=2,
+        max_position_embeddings=4096,
+        bos_token_id=tokenizer.token_to_id("<s>"),
+        eos_token_id=tokenizer.token_to_id("</s>"),
+    )
+    transformers.LlamaForCausalLM(config).save_pretrained(directory)
+    return directory
+
+
+@pytest.mark.parametrize("backend", [CPU_BF16_BACKEND, CPU_INT8_BACKEND])
+def test_generate_sentences_on_cpu(backend, model_directory, tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+
+    class TinyLlama(CausalLmSingleShot):
+        MODEL_NAME = str(model_directory)
+        _template = "{system} USER: {query} ASSISTANT:"
+        default_backend = backend
+        _generation_config = {
+            **CausalLmSingleShot._generation_config,
+            "max_new_tokens": 16,
+        }
+
+        responses = []
+
+        def shoot_batch(self, prompts, *args, **kwargs):
+            responses = super().shoot_batch(prompts, *args, **kwargs)
+            TinyLlama.responses.extend(responses)
+            return responses
+
+    word_list = DictWordList({"der Hund": "Noun", "gehen": "Verb", "schnell": "Other"})
+    meister = AiSprachMeister(TinyLlama, word_list, "cpu")
+    meister.generate_sentences(batch_size=2, obscure=False)
+
+    # The random weights answer gibberish, so only the decoding is checked
+    assert TinyLlama.responses
+    assert all(isinstance(response, str) for response in TinyLlama.responses)
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from anki_ai_helper.helper import inflection_store
+from anki_ai_helper.helper.inflection_store import InflectionStore
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    return InflectionStore("test")
+
+
+def test_build_and_look_up(store):
+    assert store.build({("noun", "Haus"): '{"Plural": "Häuser"}', ("verb", "gehen"): "{}"}) == 2
+
+    assert store.get_many("noun", ["Haus", "Maus"]) == {"Haus": '{"Plural": "Häuser"}'}
+    assert store.get("verb", "gehen") == "{}"
+    assert store.get("noun", "gehen") is None
+
+    # Merged with what is already stored
+    store.build({("noun", "Maus"): "{}"})
+    assert sorted(store.items()) == [
+        ("noun", "Haus", '{"Plural": "Häuser"}'),
+        ("noun", "Maus", "{}"),
+        ("verb", "gehen", "{}"),
+    ]
+
+    assert store.build({}, merge=False) == 0
+    assert len(store) == 0 and store.get("noun", "Haus") is None
+
+
+def test_readers_keep_the_build_they_opened(store):
+    store.build({("noun", "Haus"): "old"})
+    reader = InflectionStore("test")
+    assert reader.get("noun", "Haus") == "old"
+
+    store.build({("noun", "Haus"): "a much longer new value"})
+    assert reader.get("noun", "Haus") == "old"
+
+    reader.close()
+    assert reader.get("noun", "Haus") == "a much longer new value"
+
+
+def test_damaged_records_are_skipped(store):
+    store.build({("noun", "Haus"): "{}", ("noun", "Maus"): "{}"})
+
+    with open(store.path, "r+b") as f:
+        data = bytearray(f.read())
+        # Points the first record past the end and drops the separator of the other
+        header = inflection_store.HEADER_DTYPE.itemsize
+        index = np.frombuffer(
+            data, inflection_store.INDEX_DTYPE, count=2, offset=header
+        ).copy()
+        index[0]["length"] = 10_000
+        data[header : header + index.nbytes] = index.tobytes()
+        second = header + index.nbytes + int(index[1]["offset"])
+        data[second : second + int(index[1]["length"])] = b"x" * int(index[1]["length"])
+        f.seek(0)
+        f.write(data)
+
+    store.close()
+    assert store.get_many("noun", ["Haus", "Maus"]) == {}
+    assert list(store.items()) == []
+
+
+def test_truncated_file_is_ignored(store):
+    store.build({("noun", "Haus"): "{}"})
+    with open(store.path, "r+b") as f:
+        f.truncate(inflection_store.HEADER_DTYPE.itemsize + 4)
+
+    store.close()
+    assert store.get("noun", "Haus") is None
@@ -0,0 +1,61 @@
+import os
+import subprocess
+import sys
+
+REPO_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Loaded on first use, importing the deck must not pull them in
+HEAVY_MODULES = ["torch", "spacy", "nltk", "TTS", "pydub"]
+
+
+def test_importing_ai_sprach_meister_defers_heavy_modules():
+    code = (
+        "import sys\n"
+        "import anki_ai_helper.anki.ai_sprach_meister\n"
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=REPO_DIRECTORY,
+        capture_output=True,
+        text=True,
+    )
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == ""
+
+
+# Importing torch alone loads about 1200 modules in 2 s, spaCy about 1900.
+# pandas dominates the current import
+MAX_IMPORTED_MODULES = 1200
+MAX_IMPORT_SECONDS = 3.0
+
+
+def test_import_time_budget():
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            "import anki_ai_helper.anki.ai_sprach_meister",
+        ],
+        cwd=REPO_DIRECTORY,
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stderr
+
+    # Lines look like "import time: self [us] | cumulative | imported package"
+    # after the header line
+    rows = [
+        line.split("|")
+        for line in result.stderr.splitlines()
+        if line.startswith("import time:") and "[us]" not in line
+    ]
+    cumulative = {name.strip(): int(total) for _, total, name in rows}
+
+    assert len(rows) < MAX_IMPORTED_MODULES
+    assert (
+        cumulative["anki_ai_helper.anki.ai_sprach_meister"] / 1e6 < MAX_IMPORT_SECONDS
+    )
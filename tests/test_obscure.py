@@ -0,0 +1,75 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pytest
+
+spacy = pytest.importorskip("spacy")
+from spacy.language import Language  # noqa: E402
+
+from anki_ai_helper.helper import german as ger_helper  # noqa: E402
+
+GOLDEN_PAIRS = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "data", "obscure_golden_pairs.jsonl"
+)
+
+
+@Language.component("obscure_test_tagger")
+def _test_tagger(doc):
+    # Crude tags and lemmas, enough to exercise the POS filter and lemma masking
+    for token in doc:
+        text = token.text
+        if not text.isalpha():
+            token.pos_ = "PUNCT" if not text.isalnum() else "NUM"
+        elif text[:1].isupper() and token.i > 0:
+            token.pos_ = "NOUN"
+        elif text.endswith(("en", "e", "t", "st")):
+            token.pos_ = "VERB"
+        else:
+            token.pos_ = "ADJ"
+        token.lemma_ = text.lower()[:4]
+    return doc
+
+
+def _seeded(text: str) -> np.random.Generator:
+    seed = int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "little")
+    return np.random.default_rng(seed)
+
+
+def _test_pipeline(pairs):
+    # A blank pipeline with vectors seeded from the text, so inflections of a
+    # stem are close and Token.similarity is spaCy's own
+    nlp = spacy.blank("de")
+    nlp.add_pipe("obscure_test_tagger")
+
+    texts = {
+        token.text
+        for sentence, word in pairs
+        for token in [*nlp.make_doc(sentence), *nlp.make_doc(word)]
+    }
+    for text in sorted(texts):
+        # Some tokens keep an empty vector, like out of vocabulary words
+        if not text.isalpha() or _seeded(text).random() < 0.1:
+            continue
+        stem = _seeded(text.lower()[:4]).standard_normal(300)
+        noise = _seeded(text).standard_normal(300)
+        nlp.vocab.set_vector(text, (stem + 0.5 * noise).astype("float32"))
+
+    return nlp
+
+
+def _golden_pairs():
+    # The expected puzzles were produced on _test_pipeline by the obscuring
+    # logic before it was vectorized, one Token.similarity at a time
+    with open(GOLDEN_PAIRS) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_obscure_matches_golden_puzzles():
+    records = _golden_pairs()
+    pairs = [(record["sentence"], record["word"]) for record in records]
+
+    puzzles = ger_helper.obscure_closest_words(pairs, nlp=_test_pipeline(pairs))
+
+    assert puzzles == [record["expected"] for record in records]
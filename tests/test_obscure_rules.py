@@ -0,0 +1,65 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+pytest.importorskip("nltk")
+
+from anki_ai_helper.helper import german as ger_helper  # noqa: E402
+
+
+@pytest.mark.parametrize(
+    "sentence, word, expected",
+    [
+        # Inseparable prefixes are never split off the verb
+        (
+            "Gestern erzählt er eine Geschichte.",
+            "erzählen",
+            "Gestern ....... er eine Geschichte.",
+        ),
+        (
+            "Dann erklärt er mir die Zahl.",
+            "erzählen",
+            "Dann erklärt er mir die Zahl.",
+        ),
+        ("Der Lehrer erklärt die Aufgabe.", "erklären", "Der Lehrer ....... die Aufgabe."),
+        ("Ich fange morgen an.", "anfangen", "Ich ..... morgen ..."),
+        ("Er hat mich gestern angerufen.", "anrufen", "Er hat mich gestern .........."),
+        ("Er kommt morgen zurück.", "zurückkommen", "Er ..... morgen ......."),
+        (
+            "Er kommt zu spät zurück.",
+            "zurückkommen",
+            "Er ..... zu spät .......",
+        ),
+        (
+            "Sie ist gestern zurückgekommen.",
+            "zurückkommen",
+            "Sie ist gestern ...............",
+        ),
+        ("Die Häuser sind neu.", "das Haus", "Die ...... sind neu."),
+    ],
+)
+def test_rules_engine(sentence, word, expected):
+    assert (
+        ger_helper.obscure_closest_word(
+            sentence, ger_helper.remove_article(word), engine="rules"
+        )
+        == expected
+    )
+
+
+def test_rules_engine_in_initialized_workers():
+    # Mirrors the obscure pool of run_pipeline
+    with ProcessPoolExecutor(
+        1,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=ger_helper.load_obscure_engine,
+        initargs=("rules",),
+    ) as pool:
+        puzzles = pool.submit(
+            ger_helper.obscure_closest_words,
+            [("Ich fange morgen an.", "anfangen")],
+            engine="rules",
+        ).result()
+
+    assert puzzles == ["Ich ..... morgen ..."]
@@ -0,0 +1,119 @@
+import json
+import os
+import time
+
+import pytest
+
+from anki_ai_helper.LLM.interface import LlmSingleShot
+from anki_ai_helper.anki.ai_sprach_meister import AiSprachMeister
+from anki_ai_helper.anki.style.two_sentence_puzzler import (
+    TwoSentencePuzzlerDataFrame,
+)
+from anki_ai_helper.dataset.dict_word_list import DictWordList
+from anki_ai_helper.helper import io
+
+TYPES = ["Noun", "Verb", "Other"]
+DECLENSION = json.dumps({"Nominative": {"Singular": "der Hund", "Plural": "die"}})
+CONJUGATION = json.dumps({"Präsens": {"ich": "gehe"}})
+NAME = "plan"
+
+
+class UnusedLlm(LlmSingleShot):
+    def __init__(self, system_prompt: str):
+        raise AssertionError("plan() must not load the model")
+
+
+def _entry(i: int) -> dict:
+    entry = {
+        column: f"w{i} {column}"
+        for column in TwoSentencePuzzlerDataFrame.COLUMNS
+        if column != "word"
+    }
+    for column in entry:
+        if column.endswith("_vce"):
+            entry[column] = f"{i:06}-{column}.wav"
+    entry["expl_1"] = [DECLENSION, CONJUGATION, ""][i % 3]
+    return entry
+
+
+def _meister(n_words: int, n_entries: int, mp3: bool = True) -> AiSprachMeister:
+    # Complete entries for the first n_entries words
+    word_list = DictWordList({f"w{i}": TYPES[i % 3] for i in range(n_words)})
+    meister = AiSprachMeister(UnusedLlm, word_list, NAME)
+    entries = {f"w{i}": _entry(i) for i in range(n_entries)}
+    meister.puzzler.upsert_many(entries)
+    meister.puzzler.store(NAME)
+
+    directory = io.create_package_directory(NAME)
+    for entry in entries.values() if mp3 else []:
+        for column, value in entry.items():
+            if column.endswith("_vce"):
+                open(os.path.join(directory, value[:-4] + ".mp3"), "w").close()
+    return meister
+
+
+def _tasks(plan):
+    return {
+        stage: [(word.word, column) for word, column in tasks]
+        for stage, tasks in plan.items()
+    }
+
+
+@pytest.fixture(autouse=True)
+def home(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+
+
+def test_plan_lists_pending_tasks():
+    meister = _meister(n_words=8, n_entries=6)
+    meister.puzzler.upsert("w4", {"2_pzl": ""})
+    meister.puzzler.upsert("w5", {"1_trans_vce": ""})
+    directory = io.create_package_directory(NAME)
+    os.remove(os.path.join(directory, "000003-1_fil_vce.mp3"))
+
+    assert _tasks(meister.plan()) == {
+        "generate": [("w6", "word"), ("w7", "word")],
+        "puzzle": [("w4", "2_pzl")],
+        "declension": [("w6", "expl_1")],
+        "conjugation": [("w7", "expl_1")],
+        "voice": [("w5", "1_trans_vce")],
+        "mp3": [("w3", "1_fil_vce")],
+    }
+
+
+def test_plan_with_an_empty_puzzler():
+    meister = _meister(n_words=2, n_entries=0)
+    assert _tasks(meister.plan(stages=["generate", "puzzle"])) == {
+        "generate": [("w0", "word"), ("w1", "word")],
+        "puzzle": [],
+    }
+
+
+def test_plan_sees_rows_added_between_stages():
+    meister = _meister(n_words=4, n_entries=2)
+    assert _tasks(meister.plan(stages=["generate"]))["generate"] == [
+        ("w2", "word"),
+        ("w3", "word"),
+    ]
+
+    meister.puzzler.upsert_many({"w2": _entry(2)})
+    assert _tasks(meister.plan(stages=["generate", "voice"])) == {
+        "generate": [("w3", "word")],
+        "voice": [],
+    }
+
+
+def test_plan_is_vectorized():
+    # A per-word loop over the puzzler takes seconds at this size
+    meister = _meister(n_words=50_000, n_entries=49_990, mp3=False)
+    stages = ["generate", "puzzle", "declension", "conjugation", "voice"]
+
+    timings = []
+    for _ in range(3):
+        start = time.perf_counter()
+        plan = meister.plan(stages=stages)
+        timings.append(time.perf_counter() - start)
+
+    assert len(plan["generate"]) == 10
+    assert len(plan["conjugation"]) == 4
+    assert min(timings) < 0.5
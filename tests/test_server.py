@@ -0,0 +1,111 @@
+import os
+import socket
+import threading
+import time
+from typing import List, Optional
+
+import pytest
+
+from anki_ai_helper.LLM.interface import LlmSingleShot
+from anki_ai_helper.server import server as server_module
+from anki_ai_helper.server.client import RemoteLlm
+
+AUTHKEY = b"test-key"
+
+
+class RecordingLlm(LlmSingleShot):
+    batches: List[tuple] = []
+    exited: List[str] = []
+
+    def __init__(self, system_prompt: str):
+        self.system_prompt = system_prompt
+
+    def __enter__(self) -> "RecordingLlm":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        RecordingLlm.exited.append(self.system_prompt)
+        return True
+
+    def shoot(self, prompt: str) -> str:
+        return self.shoot_batch([prompt])[0]
+
+    def shoot_batch(
+        self,
+        prompts: List[str],
+        batch_size: int = 8,
+        max_new_tokens: Optional[int] = None,
+        json_response: bool = False,
+    ) -> List[Optional[str]]:
+        RecordingLlm.batches.append((self.system_prompt, list(prompts), max_new_tokens))
+        return [prompt.upper() for prompt in prompts]
+
+
+@pytest.fixture
+def address(tmp_path, monkeypatch):
+    monkeypatch.setattr(server_module, "_import", lambda path: RecordingLlm)
+    RecordingLlm.batches = []
+    RecordingLlm.exited = []
+
+    address = str(tmp_path / "inference.sock")
+    inference_server = server_module.InferenceServer(
+        llm="tiny", address=address, authkey=AUTHKEY, max_wait=0.5
+    )
+    inference_server.llm.max_system_prompts = 2
+    threading.Thread(target=inference_server.serve_forever, daemon=True).start()
+
+    for _ in range(100):
+        if os.path.exists(address):
+            break
+        time.sleep(0.01)
+    return address
+
+
+def _shoot(address: str, system_prompt: str, prompts: List[str], max_new_tokens):
+    with RemoteLlm(system_prompt, address=address, authkey=AUTHKEY) as llm:
+        return llm.shoot_batch(prompts, max_new_tokens=max_new_tokens, json_response=True)
+
+
+def _shoot_concurrently(address: str, requests: List[tuple]) -> List:
+    # Daemon threads, a blocked server must fail the test instead of hanging it
+    results = [None] * len(requests)
+
+    def shoot(i, request):
+        results[i] = _shoot(address, *request)
+
+    threads = [
+        threading.Thread(target=shoot, args=(i, request), daemon=True)
+        for i, request in enumerate(requests)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    return results
+
+
+def test_stalled_client_does_not_block_batching(address):
+    # Connects and never answers the key challenge
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as stalled:
+        stalled.connect(address)
+
+        results = _shoot_concurrently(
+            address, [("system", ["a", "b"], 40), ("system", ["c"], 64)]
+        )
+        assert results == [["A", "B"], ["C"]]
+
+    # Builds with different learned budgets share the batch, at the larger one.
+    # The requests may arrive in either order
+    [(system_prompt, prompts, max_new_tokens)] = RecordingLlm.batches
+    assert (system_prompt, sorted(prompts), max_new_tokens) == (
+        "system",
+        ["a", "b", "c"],
+        64,
+    )
+
+
+def test_least_recently_used_system_prompts_are_exited(address):
+    for system_prompt in ["one", "two", "one", "three"]:
+        _shoot(address, system_prompt, ["x"], None)
+
+    assert RecordingLlm.exited == ["two"]
@@ -0,0 +1,93 @@
+import sqlite3
+
+import pytest
+
+from anki_ai_helper.helper.dataframe import GenericDataFrame, SchemaMismatchError
+from anki_ai_helper.helper.storage import SqliteStorage
+
+COLUMN_TYPES = {"word": str, "translation": str, "sentence": str, "count": int}
+
+
+class RecordingStorage(SqliteStorage):
+    def __init__(self):
+        super().__init__()
+        self.loaded_columns = []
+
+    def load_columns(self, frame, filename, columns):
+        self.loaded_columns.extend(columns)
+        return super().load_columns(frame, filename, columns)
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    storage = RecordingStorage()
+    yield storage
+    storage.close()
+
+
+def _frame(storage):
+    return GenericDataFrame(COLUMN_TYPES, "word", storage=storage)
+
+
+def _rows(storage, frame):
+    connection = sqlite3.connect(storage.path("deck"))
+    try:
+        return connection.execute(
+            "SELECT word, translation, sentence, count FROM rows ORDER BY rowid"
+        ).fetchall()
+    finally:
+        connection.close()
+
+
+def test_store_writes_only_dirty_cells_and_keeps_columns_lazy(storage):
+    frame = _frame(storage)
+    frame.upsert_many(
+        {
+            f"w{i}": {"translation": f"t{i}", "sentence": f"s{i}", "count": i}
+            for i in range(3)
+        }
+    )
+    frame.store("deck")
+
+    reloaded = _frame(storage)
+    reloaded.load_and_append("deck")
+    reloaded.upsert("w1", {"sentence": "new"})
+    reloaded.upsert("w3", {"translation": "t3"})
+    reloaded.store("deck")
+
+    # Only the key column was read, by load_and_append
+    assert storage.loaded_columns == ["word"]
+    assert _rows(storage, reloaded) == [
+        ("w0", "t0", "s0", 0),
+        ("w1", "t1", "new", 1),
+        ("w2", "t2", "s2", 2),
+        ("w3", "t3", "", 0),
+    ]
+
+
+def test_update_cell_is_stored(storage):
+    frame = _frame(storage)
+    frame.upsert_many({"w0": {"translation": "t0"}, "w1": {"translation": "t1"}})
+    frame.store("deck")
+
+    reloaded = _frame(storage)
+    reloaded.load_and_append("deck")
+    reloaded.update_cell(1, "sentence", "new")
+    with pytest.raises(TypeError):
+        reloaded.update_cell(1, "count", "one")
+    reloaded.store("deck")
+
+    assert storage.loaded_columns == ["word"]
+    assert _rows(storage, reloaded) == [("w0", "t0", "", 0), ("w1", "t1", "new", 0)]
+
+
+def test_schema_is_read_from_the_table(storage):
+    frame = _frame(storage)
+    frame.upsert("w0", {"translation": "t0"})
+    frame.store("deck")
+    storage.close()
+
+    grown = GenericDataFrame({**COLUMN_TYPES, "image": str}, "word", storage=storage)
+    with pytest.raises(SchemaMismatchError):
+        grown.load_and_append("deck")